@@ -1,14 +1,14 @@
-from datetime import datetime
-import pytz
 import streamlit as st
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, AIMessageChunk
 
 from langgraph.prebuilt import create_react_agent
 from langgraph.checkpoint.memory import MemorySaver
 import uuid
 
 import os
+from router import Router
+from prompts import build_system_prompt
 from agent_tools import (
     verify_user_tool,
     search_tool,
@@ -17,8 +17,6 @@ from agent_tools import (
     update_booking_tool
 )
 
-VANCOUVER = pytz.timezone("America/Vancouver")
-today_str = datetime.now(VANCOUVER).strftime("%A, %d %B %Y")
 
 # ─── 1) MODEL SETUP ───────────────────────────────────────────────────────────────
 from dotenv import load_dotenv
@@ -54,49 +52,89 @@ my_config = {
 }
 #######################################
 
-system_prompt = f"""
-- You are GAIA (Gian's AI Agent), a funny, cheerful, helpful specialized AI Agent that will answer user's question to the best of your ability. 
-- **Before** you answer anything or call any other tool, you **must** call `verify_user` tool. 
-- Tell users you need their correct full name and id before being able to help them.
-- Once user is verified, refer to their first name often to show your friendliness.
-
-Constraints:
-- Use only standard ASCII characters (A–Z, a–z, 0–9, basic punctuation). Do not use fancy Unicode fonts or stylistic letters.
-- If you use a tool and its output contains URLs or links, you must always include those URLs in your answer, formatted as clickable markdown links. Never omit or paraphrase away the URLs. If summarizing, always cite the original links.
-- If user asks information about Canada's attractions, and anything related to Canada's tax (regulations, tax consulting offices, accounting firms, etc.), answer through 'search_tool'. 
-- Other than Canada's attraction and taxes, politely refuse to answer user's inquiry.
-- Today's date is {today_str}
-- If the user says “list my bookings” or “what are my upcoming meetings?” or anything like that, call the update_booking tool with *no* dates—just:
-```python
-update_booking()
-"""
-system_message = SystemMessage(content=system_prompt)
+# The system prompt is built per thread (ChatSession._new_input), not here: this module is imported once per
+# process, so a prompt built at import would keep the server's start date forever.
+
+# ─── 2B) LOCAL ROUTER ────────────────────────────────────────────────────────────
+# Answers credential-only and clearly off-topic messages without an LLM call (see router.py)
+router = Router(
+    is_verified=lambda: bool(st.session_state.get("verified_user")),
+    verify=lambda name, customer_id: verify_user_tool.invoke({"name": name, "customer_id": customer_id}),
+)
 
 
 # ─── 3) CHAT SESSION WRAPPER ─────────────────────────────────────────────────────
 # Creates chat session class - core of ai brain
-# basically accepts user input, sends to langgraph agent, streams back the ai response, and stores the full conv
+# basically accepts user input, sends to langgraph agent, streams back the ai response.
+# The conversation itself lives only in the agent's checkpointer (MemorySaver) - we don't keep a second copy here,
+# we just send the new message each turn and the checkpointer adds it to the thread.
 class ChatSession:
 
-    # init method runs when class is created. inputs (saves) my agent, and system message
-    def __init__(self, agent_executor, system_message):
+    # init method runs when class is created. inputs (saves) my agent, and the system prompt builder
+    def __init__(self, agent_executor, system_prompt=build_system_prompt, router=router, config=None):
         self.agent = agent_executor
-        self.history = [system_message]
+        self.system_prompt = system_prompt
+        self.router = router
+        self.config = config or my_config
+
+    def messages(self):
+        """Full conversation as stored in the checkpointer."""
+        return self.agent.get_state(self.config).values.get("messages", [])
+
+    def load_messages(self, messages):
+        """Puts a saved conversation back into an empty checkpointer (used when restoring an offloaded session)."""
+        if messages:
+            self.agent.update_state(self.config, {"messages": list(messages)}, as_node="agent")
+
+    def _new_input(self, user_text):
+        # The system message goes in once, on the first turn of the thread, with today's date at that moment.
+        # Static part first, date last -> stable cache-friendly prefix (see prompts.py)
+        msgs = [] if self.messages() else [SystemMessage(content=self.system_prompt())]
+        return msgs + [HumanMessage(content=user_text)]
+
+    def _answer_locally(self, user_text):
+        # predictable messages (credentials, off-topic) are answered locally, no LLM call.
+        # The turn is still written to the checkpointer so the agent sees it later.
+        decision = self.router.route(user_text) if self.router else None
+        if decision:
+            self.load_messages(self._new_input(user_text) + [AIMessage(content=decision.reply)])
+            return decision.reply
+        return None
 
     # Send method. The input is user text (latest message from user)
     def send(self, user_text: str) -> str:
-        # 1) record user (Appends the new user message to user.history as human message)
-        self.history.append(HumanMessage(content=user_text))
+        local = self._answer_locally(user_text)
+        if local is not None:
+            return local
+
         reply = ""
-        # 2) stream the agent, passing in your stored config
+        # stream the agent with only the new message(s); the checkpointer holds the rest
         for step in self.agent.stream(
-            {"messages": self.history},
-            config=my_config,
+            {"messages": self._new_input(user_text)},
+            config=self.config,
             stream_mode="values"
         ):
             # In each step: Update reply to most recent messgae from the ai -1.content
             reply = step["messages"][-1].content
-        # 3) Appends ai reply to self history as an AImessage.
-        self.history.append(AIMessage(content=reply))
-        # 4) returns reply as plain string.
+        # returns reply as plain string.
         return reply
+
+    # Stream method (used by voice mode). Same as send, but yields the reply text piece by piece
+    # while the model is still generating, so TTS can start on the first sentence early.
+    def stream(self, user_text: str):
+        local = self._answer_locally(user_text)
+        if local is not None:
+            yield local
+            return
+
+        # stream_mode="messages" gives (token chunk, metadata). Only text from the agent node is reply text;
+        # tool-call chunks have empty content and tool results come from the "tools" node.
+        for chunk, meta in self.agent.stream(
+            {"messages": self._new_input(user_text)},
+            config=self.config,
+            stream_mode="messages"
+        ):
+            if meta.get("langgraph_node") != "agent" or not isinstance(chunk, AIMessageChunk):
+                continue
+            if isinstance(chunk.content, str) and chunk.content:
+                yield chunk.content
@@ -6,6 +6,7 @@ import os
 from dotenv import load_dotenv
 import json
 import datetime as dt
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 
 import pandas as pd
@@ -14,48 +15,88 @@ from pymongo import MongoClient
 from langchain.tools import tool
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
 
+import outbound
+import records_snapshot
+import search_fanout
+from record_schema import KEY_FIELD, NAME_FIELD, HASH_FIELD, id_variants
+from verify_index import match_record
 from calendar_connect import get_calendar_service
 from googleapiclient.errors import HttpError
 
 # ─── 1.A) ENV in root folder  ────────────────────────────────── 
 load_dotenv() # This reads .env file and sets os.environ
-
-mongo_uri = os.environ["MONGO_URI"]
-mongo_db = os.environ["MONGO_DB"]
-mongo_coll = os.environ["MONGO_COLL"]
-openai_key = os.environ["OPENAI_API_KEY"]
-tavily_key = os.environ["TAVILY_API_KEY"]
+# Settings are read when first needed, not at import, so offline tools (prompt_report.py) can import the
+# tools without a full .env or a database.
 
 # ─── 2) SINGLETON MONGO CLIENT ─────────────────────────────────────────────────
-# One instance exist in the app to be used everywhere
-MONGO_URI = os.environ["MONGO_URI"]
-MONGO_DB  = os.environ["MONGO_DB"]
-MONGO_COL = os.environ["MONGO_COLL"]
-MONGO_CLIENT = MongoClient(MONGO_URI)
+# One instance exist in the app to be used everywhere (created on first use)
+@lru_cache(maxsize=1)
+def get_mongo_client() -> MongoClient:
+    return MongoClient(os.environ["MONGO_URI"])
+
+def get_tax_collection():
+    return get_mongo_client()[os.environ["MONGO_DB"]][os.environ["MONGO_COLL"]]
 
 # ─── 3) HELPER FUNCTIONS ────────────────────────────────────────────────────────
 def load_tax_records() -> pd.DataFrame:
     """
     Pulls all documents from Mongo collection and returns a pandas DataFrame.
+    If the local snapshot is enabled (TAX_SNAPSHOT_DIR), reads it instead - no network round trip.
     """
-    db   = MONGO_CLIENT[MONGO_DB]
-    coll = db[MONGO_COL]
-    docs = list(coll.find({}, {"_id": 0}))
+    snap = records_snapshot.open_snapshot()
+    if snap is not None:
+        return snap.to_dataframe()
+    coll = get_tax_collection()
+    docs = list(coll.find({}, {"_id": 0, HASH_FIELD: 0}))
     return pd.DataFrame(docs)
 
+def get_tax_record(customer_id) -> dict:
+    """
+    One record by Customer ID. Snapshot hash-index lookup when enabled, else an indexed find_one.
+    """
+    snap = records_snapshot.open_snapshot()
+    if snap is not None:
+        return snap.lookup(customer_id)
+    coll = get_tax_collection()
+    return coll.find_one({KEY_FIELD: {"$in": id_variants(customer_id)}}, {"_id": 0, HASH_FIELD: 0})
+
+def refresh_tax_snapshot(*customer_ids):
+    """
+    Call after writing tax records, with the Customer IDs you added/edited/deleted, so the snapshot
+    (if enabled) picks up the change. Only those records are re-read.
+    No IDs = everything may have changed (full snapshot rebuild).
+    """
+    if records_snapshot.enabled():
+        coll = get_tax_collection()
+        if customer_ids:
+            records_snapshot.apply_changes(coll, customer_ids)
+        else:
+            records_snapshot.rebuild(coll)
+
 # Less hassle to identify vancouver timezone later with this variable
 VANCOUVER = ZoneInfo("America/Vancouver")
 
-# Summarizer of chatgpt
+# Summarizer of chatgpt. One shared client; retries are left to the outbound layer (max_retries=0)
+@lru_cache(maxsize=1)
 def _get_summarizer() -> ChatOpenAI:
     return ChatOpenAI(
         model_name="gpt-4o-mini",
         temperature=0.7,
-        openai_api_key=os.environ["OPENAI_API_KEY"]
+        openai_api_key=os.environ["OPENAI_API_KEY"],
+        max_retries=0,
     )
 
+def _summarize(messages) -> str:
+    """
+    Runs the summarizer through the shared outbound layer (rate limit, backoff, hedging).
+    Identical prompts that are in flight at the same time share one LLM call.
+    """
+    key = ("summarize",) + tuple((type(m).__name__, m.content) for m in messages)
+    resp = outbound.call("openai", lambda: _get_summarizer().invoke(messages), key=key, hedge=True)
+    return getattr(resp, "content", str(resp))
+
 # ─── 4) STREAMLIT SESSION HELPER ────────────────────────────────────────────────
 
 # This is a function that will check who is the verified_user of the chat (source = verification tool)
@@ -67,29 +108,15 @@ def _get_verified_user():
 # A. The verifying user tool
 @tool("verify_user", return_direct=False)
 def verify_user_tool(name: str, customer_id: str) -> str:
-    """
-    Verifies the user by matching full name and ID. Stores in session_state.
-    """
-    # Load mongo DB database to pandas dataframe via load tex record function
-    df = load_tax_records()
-    
-    # Create a mask, compares every row's full name with 'name' input
-    mask = (
-        df["Full Name"].str.lower() == name.lower()
-    ) & (
-        df["Customer ID"].astype(str) == customer_id.strip()
-    )
-    
-    # .any() check if any row matched. If no match, return failure message 
-    if not mask.any():
+    """Verify the user by full name and customer ID. Call before anything else."""
+    # O(1) fetch of the record for that id (snapshot or indexed find_one), then a normalized name compare
+    # with a small typo tolerance (see verify_index.py)
+    row = get_tax_record(customer_id)
+    if not match_record(name, row):
         return "❌ I’m sorry, we could not verify your credentials."
-        
-    # df.loc[mask] means filter to matching rows
-    # .iloc[0] means select first match, 
-    # .to+dict() means converts into python dictionary
+
     # This is where the user data is stored in session state for later tools to use
-    row = df.loc[mask].iloc[0].to_dict()
-    user_data = {"name": row["Full Name"], "id": row["Customer ID"], "row_data": row}
+    user_data = {"name": row[NAME_FIELD], "id": row[KEY_FIELD], "row_data": row}
 
     st.session_state["verified_user"] = user_data
     
@@ -102,20 +129,15 @@ def verify_user_tool(name: str, customer_id: str) -> str:
 ##B.1. Querying personal tax info with LLM
 @tool("query_personal_tax_info", return_direct=False)
 def query_personal_tax_info_tool(question: str) -> str:
-    """
-    Queries the verified user's tax record.
-    """
+    """Answer a question about the verified user's own tax record."""
     user = _get_verified_user()
     if not user:
         return "⚠️ Please verify first using your full name and Customer ID."
 
-    df = load_tax_records()
-    user_df = df[df["Customer ID"].astype(str) == str(user["id"])]
-    if user_df.empty:
+    record = get_tax_record(user["id"])
+    if not record:
         return "❌ Could not find your record. Please verify again."
 
-    record = user_df.iloc[0].to_dict()
-
     # This is the difference, the tool's logic is now done without ifs logic, and basically just asking the llm
     # LLM can see both query and available row info for the user.
     messages = [
@@ -123,41 +145,59 @@ def query_personal_tax_info_tool(question: str) -> str:
         HumanMessage(content=f"User asked: {question}\n\nHere is their tax record:\n{record}")
     ]
 
-    # getattr is a python build in function that safely gets obj attribute. 
-    # if resp.content exists, return it. if not fallback to str(resp) and give the error message or raw text
-    resp = _get_summarizer().invoke(messages)
-    return getattr(resp, "content", str(resp))
+    # _summarize returns resp.content (or str(resp) if there is no content, e.g. an error message)
+    return _summarize(messages)
 
 # C. Search tool with tavily
+@lru_cache(maxsize=1)
+def _get_tavily() -> TavilySearchAPIWrapper:
+    return TavilySearchAPIWrapper(tavily_api_key=os.environ["TAVILY_API_KEY"])
+
+def _tavily_search(query: str):
+    # The API wrapper, not the TavilySearchResults tool: the tool catches API errors and returns them as a string,
+    # which would hide 429s/5xx from the outbound retry and hand the error text to every coalesced caller.
+    return outbound.call(
+        "tavily",
+        lambda: _get_tavily().results(query, max_results=3),
+        key=("tavily", query.strip().lower()),
+    )
+
+def _parse_results(raw):
+    """Tavily output as a list of result dicts, or None if it's an error string / something else."""
+    try:
+        items = json.loads(raw) if isinstance(raw, str) else raw
+    except json.JSONDecodeError:
+        return None
+    return items if isinstance(items, list) else None
+
 @tool("search_tool", return_direct=False)
 def search_tool(query: str) -> str:
-    """
-    Pleasantly summarize the search results ahout Canada's attractions and tax related inquiries (regulations, tax consulting offices, accounting firms, etc.)into one concise paragraph while also preserving the original URL or cite the link so user can click and read more
-    """
+    """Web search about Canada's attractions or taxes. Put related questions in one query. Returns a short summary with source links."""
     #a. check if user is verified, reject if not.
     user = _get_verified_user()
     if not user:
         return "⚠️ Please verify first before searching."
 
-    #b. do tavily search. returns json or python list (because the API might get python list or dict, raw json, or error).
-    # at this point, raw could be python list, messy string, or error string.
-    raw = TavilySearchResults(
-        max_results=3,
-        api_key=os.environ["TAVILY_API_KEY"]
-    ).invoke(query)
+    #b. split compound questions into sub-queries and search them all at once (see search_fanout.py).
+    # each tavily search goes through the outbound layer: same query from several sessions at once -> one Tavily call
+    # it returns json or python list (because the API might get python list or dict, raw json, or error).
+    sub_queries = search_fanout.split_query(query)
+    try:
+        raws = search_fanout.fan_out(sub_queries, _tavily_search)
+    except Exception as e:
+        # retries already happened in the outbound layer; this is a real outage or a bad request
+        return f"❌ Search is not available right now ({type(e).__name__}). Please try again in a moment."
 
     #c. So we try. USE json.loads(raw) if the raw is JSON string and not list (e.g. "["blah"]")
     # if its already python list, just raw (else raw) (e.g. ["blah"])
-    try:
-        items = json.loads(raw) if isinstance(raw, str) else raw
-
-    #d. if its error message string we dont crash, we show raw error.
-    except json.JSONDecodeError:
-        return raw
+    #d. if its error message string we dont crash, we keep it aside.
+    #e. if no sub-query gave a list, bail out early and return original raw (instead of breaking summarizer)
+    result_lists = [items for items in map(_parse_results, raws) if items is not None]
+    if not result_lists:
+        return raws[0]
 
-    #e. if still fails, bail out early and return original raw (instead of breaking summarizer)
-    if not isinstance(items, list):
-        return raw
+    # one list of results: round-robin over the sub-queries, duplicate urls / near-identical content dropped
+    items = search_fanout.merge(result_lists)
 
     #f. Initializing empty list to store individual formatted summaries (1 per result).
     snippets = []
@@ -184,29 +224,19 @@ def search_tool(query: str) -> str:
     #n. just using langchain's way of invoking llm. Ask it to preserve url. it works, but maybe tavily is a bit too simple? the url leads to homepage only.
     system = SystemMessage(content="""
     Pleasantly summarize the following search results into one concise paragraph while also preserving the original URL or cite the link so user can click and read more""")
+    if len(sub_queries) > 1:
+        # one summary for the whole compound question, so make sure every part gets answered
+        system = SystemMessage(content=system.content + "\nThe results cover these questions, answer each of them: " + "; ".join(sub_queries))
     human  = HumanMessage(content=raw_block)
-    resp   = _get_summarizer().invoke([system, human])
-    return getattr(resp, "content", str(resp))
+    return _summarize([system, human])
 
 #D. Create booking with google calendar TOOL
 @tool("create_booking", return_direct=False)
 def create_booking_tool(date_time: str, meeting_topic: str) -> str:
     """
-    Creates a new booking on Google Calendar for the verified user.
-    When you call this tool, you must:
-
-    1. **Extract** the date and time from the user’s sentence (e.g. “19 May 2025 at 12 PM”)  
-    2. **Reformat** it into the exact ISO format **YYYY-MM-DD HH:MM** (24-hour clock, America/Vancouver)  
-    3. **Pass** that string as the first argument, and a brief meeting topic string as the second.
-
-    **Example**  
-    If the user says:  
-    > “Book meeting 19 May 2025, 12 PM about my son’s taxes”  
-
-    You should invoke:  
-    create_booking("2025-05-19 12:00", "my son’s taxes")
-    Remember to always provide the download ics file as a clickable format when outputting answers.
-    This part below -> [Download .ics file](data:text/calendar;base64,{b64})
+    Book a meeting for the verified user.
+    date_time: "YYYY-MM-DD HH:MM", 24h, Vancouver time (e.g. "19 May 2025, 12 PM" -> "2025-05-19 12:00").
+    meeting_topic: short topic. Always show the returned .ics link.
     """
 # User must be verified
     user = _get_verified_user()
@@ -334,16 +364,8 @@ def parse_datetime(input_val):
 @tool("update_booking", return_direct=False)
 def update_booking_tool(original_datetime: str = "", new_datetime: str = "") -> str:
     """
-    Manage your existing bookings. There are three behaviors:
-
-    1️. **List**  
-      If you call **with no arguments** (`original_datetime=None`), I'll list all future bookings.
-
-    2️. **Cancel**  
-      If you supply only original_datetime and `new_datetime="cancel"`, I'll delete that booking.
-
-    3️. **Reschedule**  
-      If you supply both original_datetime and new_datetime, I'll move the booking.
+    List, cancel or reschedule the user's bookings. Datetimes are "YYYY-MM-DD HH:MM".
+    No args: list. original_datetime + new_datetime="cancel": cancel. Both datetimes: reschedule.
     """
 
     #1. Check if user is verified
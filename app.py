@@ -14,34 +14,90 @@ if langsmith_key:
 else:
     st.warning("⚠️ LangSmith key not found — tracing is OFF.")
 
+# Router decisions and other GAIA logs go to the terminal
+import logging
+logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s")
+logging.getLogger("gaia").setLevel(logging.INFO)
+
 # 3) All other imports
-from agent_tools import load_tax_records
-from agent_core import model, tools, system_message, ChatSession
+from agent_tools import get_mongo_client, refresh_tax_snapshot
+import records_query
+import tax_engine
+from record_schema import with_hash
+from agent_core import model, tools, ChatSession
 from langgraph.checkpoint.memory import MemorySaver
 from pymongo import MongoClient
 import uuid
 import openai
 from whisper import whisper_stt
-import base64
+import outbound
+import voice_pipeline
+from audio_cache import TTS_CACHE
+import session_memory
+import transcript_view
+import streamlit.components.v1 as components
 import re
+import time
 
 MONGO_URI  = os.environ["MONGO_URI"]
 MONGO_DB   = os.environ["MONGO_DB"]
 MONGO_COLL = os.environ["MONGO_COLL"]
 openai.api_key = os.environ["OPENAI_API_KEY"]
 
+# Mark this browser session as active; restores it if it was offloaded while idle, and now and then
+# offloads/evicts other idle sessions (see session_memory.py)
+session_memory.touch()
+
 # for voice replies
-def tts_audio(text, voice="nova"):                  # voice choices: alloy, echo, fable, onyx, nova, shimmer
-    client = openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"]) 
-    response = client.audio.speech.create(
-        model="gpt-4o-mini-tts",  
-        voice=voice,    
-        input=text,
+# one shared client; retries/rate limiting happen in the outbound layer
+tts_client = openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"], max_retries=0)
+
+def tts_file(text, voice="nova", model="gpt-4o-mini-tts"):   # voice choices: alloy, echo, fable, onyx, nova, shimmer
+    """
+    Path to an MP3 of text. Played with st.audio (served by Streamlit's media endpoint, not inlined in the HTML).
+    Cached on disk by (model, voice, text), so repeated phrases are only synthesized once.
+    """
+    key = TTS_CACHE.make_key(model, voice, text)
+    cached = TTS_CACHE.get_path(key, ".mp3")
+    if cached:
+        return cached
+    response = outbound.call(
+        "openai",
+        lambda: tts_client.audio.speech.create(
+            model=model,
+            voice=voice,
+            input=text,
+        ),
+        key=("tts", voice, text),
+        hedge=True,
     )
-    audio_data = response.content  # raw MP3 bytes
-    b64 = base64.b64encode(audio_data).decode()
-    audio_html = f'<audio controls autoplay src="data:audio/mp3;base64,{b64}"></audio>'
-    return audio_html
+    return TTS_CACHE.put(key, ".mp3", response.content)   # raw MP3 bytes
+
+# ─── session‐scoped memory & agent ─────────────────────────────
+# Used by the text and voice pages. Everything is created lazily, so a session whose memory was
+# freed by session_memory (idle eviction/offload) just gets a fresh agent here on its next run.
+def ensure_chat_session():
+    if "memory" not in st.session_state:
+        st.session_state["memory"] = MemorySaver()
+
+    if "agent" not in st.session_state:
+        from agent_core import create_react_agent
+        st.session_state["agent"] = create_react_agent(
+            model,
+            tools,
+            checkpointer=st.session_state["memory"],
+        )
+
+    # ─── now pass THIS session's agent into ChatSession ──────────
+    if "chat" not in st.session_state:
+        st.session_state.chat = ChatSession(st.session_state["agent"])
+        # offloaded conversation coming back? put it into the new checkpointer
+        st.session_state.chat.load_messages(session_memory.pending_messages())
+
+    for key in ("past", "generated", "voice_history"):
+        if key not in st.session_state:
+            st.session_state[key] = []
+    return st.session_state.chat
 
 # Helper function so links are just text
 
@@ -110,16 +166,15 @@ if page == "🛠️ Admin - Add Record":
         total_income = st.number_input("Total Income", min_value=0, step=100)
         deductions   = st.number_input("Deductions", min_value=0, step=100)
 
-        # --- derived fields ---
-        taxable_income = total_income - deductions
-        st.markdown(f"**Taxable Income:** {taxable_income:,}")
+        tax_paid     = st.number_input("Tax Paid", min_value=0, step=100)
 
-        TAX_RATE = 0.15
-        tax_due = taxable_income * TAX_RATE
-        st.markdown(f"**Tax Due (@ {TAX_RATE*100:.0f}%):** {tax_due:,.2f}")
-
-        tax_paid   = st.number_input("Tax Paid", min_value=0, step=100)
-        refund_bal = tax_paid - tax_due
+        # --- derived fields (same tax_engine rules as Manage Records and the bulk recompute job) ---
+        derived = tax_engine.compute_record(total_income, deductions, tax_paid)
+        taxable_income = derived["Taxable Income"]
+        tax_due        = derived["Tax Due"]
+        refund_bal     = derived["Refund/Balance"]
+        st.markdown(f"**Taxable Income:** {taxable_income:,}")
+        st.markdown(f"**Tax Due ({tax_engine.DEFAULT_RULES['name']} rules):** {tax_due:,.2f}")
         st.markdown(f"**Refund / Balance:** {refund_bal:,.2f}")
 
         submitted = st.form_submit_button("Submit Record")
@@ -130,7 +185,8 @@ if page == "🛠️ Admin - Add Record":
         coll   = db[MONGO_COLL]
 
         # left is my db column names, right are the variable name for streamlit form
-        coll.insert_one({
+        # with_hash adds the Row Hash so the incremental csv sync can tell this row apart
+        coll.insert_one(with_hash({
             "Full Name":      full_name,
             "Customer ID":    customer_id,
             "Total Income":   total_income,
@@ -139,36 +195,71 @@ if page == "🛠️ Admin - Add Record":
             "Tax Due":        tax_due,
             "Tax Paid":       tax_paid,
             "Refund/Balance": refund_bal
-        })
+        }))
+        refresh_tax_snapshot(customer_id)
         st.success("✅ New tax record added! It may now chat with GAIA and it will be personalized!")
 
 # --- MANAGE TAX RECORDS ---
 elif page == "⚙️ Admin - Manage Records":
     st.title("⚙️ Manage Tax Records")
-    df = load_tax_records()
+    coll = get_mongo_client()[MONGO_DB][MONGO_COLL]
+
+    # Search / sort controls. Only the rows of the current page are fetched from Mongo.
+    c1, c2, c3, c4 = st.columns([3, 2, 1, 1])
+    search     = c1.text_input("Search by name prefix or Customer ID")
+    sort_field = c2.selectbox("Sort by", records_query.SORTABLE_FIELDS)
+    ascending  = c3.radio("Order", ["Asc", "Desc"], horizontal=True) == "Asc"
+    page_size  = c4.selectbox("Rows", [25, 50, 100])
+
+    # cursors = stack of page start positions, so we can go back as well as forward.
+    # When the search or sort changes, start again from page 1.
+    view = (search, sort_field, ascending, page_size)
+    if st.session_state.get("records_view") != view:
+        st.session_state["records_view"]    = view
+        st.session_state["records_cursors"] = [None]
+    cursors = st.session_state["records_cursors"]
+
+    df, next_cursor = records_query.fetch_page(
+        coll, search=search, sort_field=sort_field, ascending=ascending,
+        cursor=cursors[-1], page_size=page_size,
+    )
+    total, capped = records_query.estimate_count(coll, search)
+    st.caption(f"Page {len(cursors)} · about {total:,}{'+' if capped else ''} matching records")
     st.dataframe(df)
-    cust_ids = df["Customer ID"].astype(str).tolist()
+
+    prev_col, next_col = st.columns(2)
+    if prev_col.button("⬅️ Previous", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if next_col.button("Next ➡️", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+
+    cust_ids = df["Customer ID"].astype(str).tolist() if not df.empty else []
     selected = st.selectbox("Select Customer ID to manage", [""] + cust_ids)
-    if selected:
-        record = df[df["Customer ID"].astype(str) == selected].iloc[0].to_dict()
+    record = records_query.get_record(coll, selected) if selected else None
+    if record:
+        # Use the stored value (int from csv, str from the form) so update/delete actually match
+        key = {"Customer ID": record["Customer ID"]}
         with st.form(key="edit_record_form"):
             fn = st.text_input("Full Name", value=record["Full Name"])
             ci = st.text_input("Customer ID", value=str(record["Customer ID"]))
             ti = st.number_input("Total Income", value=int(record.get("Total Income",0)))
             dd = st.number_input("Deductions", value=int(record.get("Deductions",0)))
-            txi= st.number_input("Taxable Income", value=int(record.get("Taxable Income",0)))
-            txd= st.number_input("Tax Due", value=int(record.get("Tax Due",0)))
             txp= st.number_input("Tax Paid", value=int(record.get("Tax Paid",0)))
-            rf = st.number_input("Refund/Balance", value=int(record.get("Refund/Balance",0)))
+            # Derived fields are recomputed on save so they can never drift from the inputs
+            st.caption(
+                f"Taxable Income {record.get('Taxable Income', 0):,} · Tax Due {record.get('Tax Due', 0):,} · "
+                f"Refund/Balance {record.get('Refund/Balance', 0):,} (recalculated on save)"
+            )
             save   = st.form_submit_button("Save Changes")
             delete = st.form_submit_button("Delete Record")
-        client = MongoClient(MONGO_URI)
-        db     = client[MONGO_DB]
-        coll   = db[MONGO_COLL]
         if save:
+            derived = tax_engine.compute_record(ti, dd, txp)
+            txi, txd, rf = derived["Taxable Income"], derived["Tax Due"], derived["Refund/Balance"]
             coll.update_one(
-                {"Customer ID": selected},
-                {"$set":{
+                key,
+                {"$set": with_hash({
                     "Full Name": fn,
                     "Customer ID": ci,
                     "Total Income": ti,
@@ -177,13 +268,35 @@ elif page == "⚙️ Admin - Manage Records":
                     "Tax Due": txd,
                     "Tax Paid": txp,
                     "Refund/Balance": rf
-                }}
+                })}
             )
+            refresh_tax_snapshot(record["Customer ID"], ci)     # old and new ID, in case it was changed
             st.success(f"✅ Updated record for {ci}.")
         if delete:
-            coll.delete_one({"Customer ID": selected})
+            coll.delete_one(key)
+            refresh_tax_snapshot(record["Customer ID"])
             st.success(f"🗑️ Deleted record for {selected}.")
 
+    # Bulk job: bring every record's derived fields in line with the current tax rules (runs inside Mongo)
+    with st.expander("🧮 Recompute derived fields for all records"):
+        st.write(f"Uses the **{tax_engine.DEFAULT_RULES['name']}** rules for Taxable Income, Tax Due and Refund/Balance.")
+        if st.button("Recompute all"):
+            n = tax_engine.recompute_all(coll)     # also rebuilds the snapshot, if enabled
+            st.success(f"✅ Recomputed {n:,} records.")
+
+    # Per-session memory use of the chat sessions in this server process
+    with st.expander("🧠 Session memory"):
+        st.write(
+            f"Idle sessions are **{session_memory.POLICY}ed** after {session_memory.IDLE_TTL_S / 60:.0f} min"
+            + (f", budget {session_memory.BUDGET_BYTES // (1024 * 1024)} MB." if session_memory.BUDGET_BYTES else ".")
+        )
+        if st.button("Clean up idle sessions now"):
+            n = session_memory.sweep(force=True)
+            st.success(f"✅ Cleaned up {n} idle session(s).")
+        rows = session_memory.report()
+        st.caption(f"{len(rows)} session(s) · {sum(r['Total (KB)'] for r in rows):,.0f} KB total")
+        st.dataframe(rows)
+
 # --- VOICE CHATBOT UI ---
 elif page == "🎤 Client - Voice Chat with GAIA (experimental)":
     st.title("🎤 Voice Chat with GAIA (experimental)")
@@ -191,32 +304,66 @@ elif page == "🎤 Client - Voice Chat with GAIA (experimental)":
     st.info("Click 'Start recording', ask your question, then click 'Stop'. GAIA will reply with voice. Previous questions and answers are shown below as text.")
 
     # Record and transcribe audio
-    voice_text = whisper_stt(language="en", key="voice_chat")
+    # just_once: a transcript is returned only on the run it was recorded, so other reruns
+    # (toggles, navigation) don't re-send it to GAIA and re-synthesize the reply
+    voice_text = whisper_stt(language="en", key="voice_chat", just_once=True)
+
+    # Pipelined mode speaks sentence by sentence while GAIA is still answering
+    pipelined = st.toggle("⚡ Start speaking sooner (sentence by sentence)", value=True)
 
     if voice_text:
         st.success(f"🗣️ Transcribed: {voice_text}")
+        prep = st.session_state.pop("_last_audio_preprocess", None)
+        if prep and prep["processed"]:
+            st.caption(
+                f"🎚️ Upload shrunk {prep['in_bytes']:,} → {prep['out_bytes']:,} bytes "
+                f"({prep['in_seconds']}s → {prep['out_seconds']}s audio) in {prep['ms']:.0f} ms"
+            )
 
-        # Send to GAIA agent and get response
-        response = st.session_state.chat.send(voice_text)
+        ensure_chat_session()
 
-        # Save history (init if not exists)
-        if "voice_history" not in st.session_state:
-            st.session_state.voice_history = []
+        st.markdown("**GAIA's Response (Audio):**")
+        if pipelined:
+            # Each sentence is synthesized as soon as it is complete; the small script below plays the
+            # clips in the "gaia_voice_reply" container one after another while later ones are still coming.
+            components.html(voice_pipeline.AUDIO_CHAIN_JS % {"key": "gaia_voice_reply"}, height=0)
+            started = time.monotonic()
+            first_audio_at = None
+            spoken = []
+
+            def _speak(sentence):
+                speakable = strip_markdown_links(sentence).strip()
+                return tts_file(speakable) if speakable else None
+
+            text_box = st.empty()
+            with st.container(key="gaia_voice_reply"):
+                for i, sentence, audio in voice_pipeline.pipelined_tts(st.session_state.chat.stream(voice_text), _speak):
+                    spoken.append(sentence)
+                    text_box.markdown(" ".join(spoken))
+                    if audio:
+                        if first_audio_at is None:
+                            first_audio_at = time.monotonic() - started
+                        st.audio(audio, format="audio/mp3", autoplay=(i == 0))
+            response = " ".join(spoken)
+            if first_audio_at is not None:
+                st.caption(f"⏱️ Time to first audio: {first_audio_at:.1f}s · full reply: {time.monotonic() - started:.1f}s")
+        else:
+            # Send to GAIA agent and get response, then one TTS call over the whole reply
+            started = time.monotonic()
+            response = st.session_state.chat.send(voice_text)
+            tts_input = strip_markdown_links(response)
+            st.audio(tts_file(tts_input), format="audio/mp3", autoplay=True)
+            st.caption(f"⏱️ Time to first audio: {time.monotonic() - started:.1f}s")
 
         st.session_state.voice_history.append((voice_text, response))
-
-        # Play the latest response as audio
-        st.markdown("**GAIA's Response (Audio):**")
-        tts_input = strip_markdown_links(response)
-        st.markdown(tts_audio(tts_input), unsafe_allow_html=True)
         st.info("You can ask another question below.")
 
     # Show text Q&A history (no audio, no replay buttons)
     if st.session_state.get("voice_history"):
         with st.expander("📝 Previous Voice Q&A"):
-            for i, (q, a) in enumerate(reversed(st.session_state.voice_history)):
-                st.markdown(f"**Q{len(st.session_state.voice_history)-i}:** {q}")
-                st.markdown(f"**A{len(st.session_state.voice_history)-i}:** {a}")
+            transcript_view.render_transcript(
+                st.session_state.voice_history, key="voice_history", style="qa", newest_first=True
+            )
 
 
 # --- CHATBOT (GAIA) UI ---
@@ -241,41 +388,25 @@ else:
     )
 
 
-        # ─── session‐scoped memory & agent ─────────────────────────────
-    if "memory" not in st.session_state:
-        from langgraph.checkpoint.memory import MemorySaver
-        st.session_state["memory"] = MemorySaver()
-
-    if "agent" not in st.session_state:
-        from agent_core import create_react_agent, model, tools
-        st.session_state["agent"] = create_react_agent(
-            model,
-            tools,
-            checkpointer=st.session_state["memory"],
-        )
-
-    # ─── now pass THIS session's agent into ChatSession ──────────
-    if "chat" not in st.session_state:
-        st.session_state.chat = ChatSession(
-            st.session_state["agent"],
-            system_message
-        )
-        st.session_state.past      = []
-        st.session_state.generated = []
+    # ─── session‐scoped memory & agent (see ensure_chat_session) ─────
+    ensure_chat_session()
 
 
     def _on_enter():
         txt = st.session_state.user_input.strip()
         if not txt:
             return
-        resp = st.session_state.chat.send(txt)
+        # callbacks run before the page script, so make sure the session is (re)built first
+        session_memory.touch()
+        resp = ensure_chat_session().send(txt)
         st.session_state.past.append(txt)
         st.session_state.generated.append(resp)
         st.session_state.user_input = ""
     
-    for u, b in zip(st.session_state.past, st.session_state.generated):
-        st.chat_message("user").write(u)
-        st.chat_message("assistant").write(b)
+    # only the latest turns are drawn; older ones on request (see transcript_view.py)
+    transcript_view.render_transcript(
+        transcript_view.PairedTurns(st.session_state.past, st.session_state.generated), key="chat"
+    )
             
     #text input field must be rendered after input set
     st.text_input(
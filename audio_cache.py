@@ -0,0 +1,92 @@
+# Disk-backed, content-addressed caches for voice mode.
+#
+#   TTS_CACHE: (model, voice, text)            -> .mp3 file   (fixed phrases like greetings/refusals are synthesized once)
+#   STT_CACHE: (model, language, audio bytes)  -> .txt file   (re-submitted audio isn't transcribed again)
+#
+# Keys are SHA-256 hashes of the content, so the same input always maps to the same file, across sessions and restarts.
+# Each cache has a size limit; when it is exceeded the least recently used files are deleted (hits refresh mtime).
+# Sizes/locations can be changed in .env: TTS_CACHE_DIR, TTS_CACHE_MB, STT_CACHE_DIR, STT_CACHE_MB.
+
+import hashlib
+import os
+import tempfile
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class DiskCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        h = hashlib.sha256()
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+            h.update(len(data).to_bytes(8, "little"))   # length prefix so ("ab","c") != ("a","bc")
+            h.update(data)
+        return h.hexdigest()
+
+    def path_for(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def get_path(self, key, suffix):
+        """Path of the cached file (and marks it recently used), or None."""
+        path = self.path_for(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, suffix, data):
+        """Stores data atomically and returns its path, then evicts old entries if over the limit."""
+        path = self.path_for(key, suffix)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._evict()
+        return path
+
+    def _evict(self):
+        with self.lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if name.endswith(".tmp"):
+                    continue
+                full = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(full)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, full))
+                total += st.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, full in sorted(entries):      # oldest first
+                try:
+                    os.remove(full)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self):
+        files = [os.path.join(self.directory, n) for n in os.listdir(self.directory) if not n.endswith(".tmp")]
+        return {"files": len(files), "bytes": sum(os.path.getsize(f) for f in files if os.path.exists(f))}
+
+
+def _mb(name, default):
+    return int(float(os.environ.get(name, default)) * 1024 * 1024)
+
+TTS_CACHE = DiskCache(os.environ.get("TTS_CACHE_DIR", ".cache/tts"), _mb("TTS_CACHE_MB", 200))
+STT_CACHE = DiskCache(os.environ.get("STT_CACHE_DIR", ".cache/stt"), _mb("STT_CACHE_MB", 20))
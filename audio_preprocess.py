@@ -0,0 +1,208 @@
+# Local audio clean-up before sending a recording to Whisper.
+#
+# The mic recorder hands us the raw capture: leading/trailing silence, stereo, 44.1/48 kHz.
+# Whisper works at 16 kHz mono anyway, so we shrink the upload first (all NumPy, no extra services):
+#   1) decode the WAV      2) downmix to mono      3) trim silence with energy-based voice activity detection
+#   4) resample to 16 kHz  5) write 16-bit WAV, or optionally re-encode to a compact codec (mp3/ogg via pydub + ffmpeg)
+# preprocess() returns the new bytes plus stats (bytes saved, processing time). Non-WAV input is passed through.
+#
+# Try it offline on a synthetic recording:  python audio_preprocess.py
+
+import io
+import logging
+import struct
+import time
+import wave
+
+import numpy as np
+
+logger = logging.getLogger("gaia.audio")
+
+TARGET_RATE = 16_000
+FRAME_MS = 20
+SILENCE_DB = -45.0        # frames quieter than this (dBFS) count as silence...
+RELATIVE_DB = -35.0       # ...as do frames this far below the loudest frame
+PAD_MS = 200              # keep a little audio around the speech so words aren't clipped
+
+_PCM, _FLOAT, _EXTENSIBLE = 1, 3, 0xFFFE
+
+
+# ─── 1) WAV DECODE / ENCODE ─────────────────────────────────────────────────────
+def is_wav(data):
+    return len(data) >= 12 and data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+def decode_wav(data):
+    """
+    Returns (float32 samples shaped [frames, channels] in -1..1, sample rate).
+    Reads the RIFF chunks directly so 8/16/24/32-bit PCM and 32/64-bit float WAVs all work
+    (browsers often record float WAV, which the stdlib wave module can't open).
+    """
+    pos, fmt, raw = 12, None, None
+    while pos + 8 <= len(data):
+        chunk_id, size = data[pos:pos + 4], struct.unpack("<I", data[pos + 4:pos + 8])[0]
+        body = data[pos + 8:pos + 8 + size]
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", body[:16])
+            if fmt[0] == _EXTENSIBLE:
+                fmt = (struct.unpack("<H", body[24:26])[0],) + fmt[1:]
+        elif chunk_id == b"data":
+            raw = body
+        pos += 8 + size + (size & 1)
+    if fmt is None or raw is None:
+        raise ValueError("Not a readable WAV file")
+
+    code, channels, rate, _, _, bits = fmt
+    width = bits // 8
+    raw = raw[:len(raw) - len(raw) % (width * channels)]
+    if code == _FLOAT:
+        samples = np.frombuffer(raw, dtype="<f4" if bits == 32 else "<f8").astype(np.float32)
+    elif code == _PCM and bits == 8:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif code == _PCM and bits == 16:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    elif code == _PCM and bits == 24:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = (b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16))
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        samples = ints.astype(np.float32) / 8388608
+    elif code == _PCM and bits == 32:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported WAV encoding (format {code}, {bits} bits)")
+    return samples.reshape(-1, channels), rate
+
+def encode_wav(samples, rate):
+    """Mono float samples -> 16-bit PCM WAV bytes."""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+# ─── 2) SIGNAL STEPS ────────────────────────────────────────────────────────────
+def downmix(samples):
+    return samples.mean(axis=1) if samples.ndim == 2 else samples
+
+def trim_silence(mono, rate, silence_db=SILENCE_DB, relative_db=RELATIVE_DB, pad_ms=PAD_MS):
+    """
+    Energy-based VAD: RMS level per 20 ms frame, a frame is speech if it is above both thresholds.
+    Keeps everything from the first to the last speech frame (plus padding). All-silent input -> empty.
+    """
+    frame = max(1, rate * FRAME_MS // 1000)
+    n_frames = len(mono) // frame
+    if n_frames == 0:
+        return mono
+    frames = mono[:n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt((frames.astype(np.float64) ** 2).mean(axis=1))
+    db = 20 * np.log10(np.maximum(rms, 1e-10))
+    voiced = np.flatnonzero((db > silence_db) & (db > db.max() + relative_db))
+    if voiced.size == 0:
+        return mono[:0]
+    pad = pad_ms * rate // 1000
+    start = max(0, voiced[0] * frame - pad)
+    end = min(len(mono), (voiced[-1] + 1) * frame + pad)
+    return mono[start:end]
+
+def _lowpass_kernel(cutoff, taps=63):
+    # windowed-sinc FIR; cutoff as a fraction of the input sample rate (0..0.5)
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return kernel / kernel.sum()
+
+def resample(mono, rate, target=TARGET_RATE):
+    """Anti-alias low-pass (when downsampling) then linear interpolation onto the new time grid."""
+    if rate == target or len(mono) == 0:
+        return mono.astype(np.float32)
+    if target < rate:
+        mono = np.convolve(mono, _lowpass_kernel(0.45 * target / rate), mode="same")
+    n_out = int(round(len(mono) * target / rate))
+    t_out = np.arange(n_out) * (rate / target)
+    return np.interp(t_out, np.arange(len(mono)), mono).astype(np.float32)
+
+
+# ─── 3) OPTIONAL COMPACT CODEC ──────────────────────────────────────────────────
+def encode_compact(wav_bytes, codec):
+    """Re-encode with pydub/ffmpeg if they are installed; returns None when not available."""
+    try:
+        from pydub import AudioSegment
+    except ImportError:
+        return None
+    try:
+        out = io.BytesIO()
+        AudioSegment.from_wav(io.BytesIO(wav_bytes)).export(out, format=codec)
+        return out.getvalue()
+    except Exception as e:          # usually ffmpeg missing
+        logger.warning("audio: %s encoding failed (%s); sending WAV", codec, e)
+        return None
+
+
+# ─── 4) PIPELINE ────────────────────────────────────────────────────────────────
+def preprocess(data, target_rate=TARGET_RATE, codec=None):
+    """
+    Returns (bytes to upload, file name for the upload, stats dict).
+    codec: None for 16-bit WAV, or e.g. "mp3" / "ogg" to re-encode (falls back to WAV if unavailable).
+    """
+    started = time.perf_counter()
+    stats = {"in_bytes": len(data), "out_bytes": len(data), "saved_bytes": 0, "ms": 0.0, "processed": False}
+    if not is_wav(data):
+        return data, "audio.mp3", stats
+
+    samples, rate = decode_wav(data)
+    in_seconds = len(samples) / rate if rate else 0
+    mono = trim_silence(downmix(samples), rate)
+    if len(mono) == 0:              # nothing but silence: let Whisper see the original rather than an empty file
+        return data, "audio.wav", stats
+    mono = resample(mono, rate, target_rate)
+    out, name = encode_wav(mono, target_rate), "audio.wav"
+    if codec:
+        compact = encode_compact(out, codec)
+        if compact is not None:
+            out, name = compact, f"audio.{codec}"
+
+    stats.update(ms=(time.perf_counter() - started) * 1000, in_seconds=round(in_seconds, 2))
+    if len(out) >= len(data):       # never make the upload bigger: the original goes up as it is
+        stats.update(out_seconds=stats["in_seconds"])
+        logger.info("audio: processed file not smaller, uploading the original %d bytes", len(data))
+        return data, "audio.wav", stats
+    stats.update(
+        out_bytes=len(out),
+        saved_bytes=len(data) - len(out),
+        processed=True,
+        out_seconds=round(len(mono) / target_rate, 2),
+    )
+    logger.info("audio: %d -> %d bytes (saved %d) in %.1f ms", stats["in_bytes"], stats["out_bytes"],
+                stats["saved_bytes"], stats["ms"])
+    return out, name, stats
+
+
+def synthetic_wav(rate=48_000, channels=2, silence_s=1.0, speech_s=1.5, bits=16):
+    """Test recording: silence, a 'voice-like' tone burst, silence. Handy for offline checks."""
+    t = np.arange(int(speech_s * rate)) / rate
+    tone = 0.3 * np.sin(2 * np.pi * 220 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+    quiet = 0.0005 * np.random.default_rng(0).standard_normal(int(silence_s * rate))
+    mono = np.concatenate([quiet, tone, quiet])
+    frames = np.repeat(mono[:, None], channels, axis=1)
+    if bits == 32:
+        raw = frames.astype("<f4").tobytes()
+        fmt_code = _FLOAT
+    else:
+        raw = (frames * 32767).astype("<i2").tobytes()
+        fmt_code = _PCM
+    block = channels * bits // 8
+    fmt = struct.pack("<HHIIHH", fmt_code, channels, rate, rate * block, block, bits)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(raw)) + raw
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+if __name__ == "__main__":
+    for bits in (16, 32):
+        data = synthetic_wav(bits=bits)
+        out, name, stats = preprocess(data)
+        decoded, rate = decode_wav(out)
+        print(f"{bits}-bit 48 kHz stereo, {stats['in_seconds']}s -> {name} {rate} Hz mono, {stats['out_seconds']}s: "
+              f"{stats['in_bytes']:,} -> {stats['out_bytes']:,} bytes "
+              f"({stats['saved_bytes'] / stats['in_bytes']:.0%} saved) in {stats['ms']:.1f} ms")
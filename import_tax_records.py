@@ -1,13 +1,276 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, InsertOne, DeleteMany
+from pymongo.errors import OperationFailure
 import pandas as pd
+import argparse
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
+import records_query
+import records_snapshot
+import tax_engine
+from record_schema import KEY_FIELD, HASH_FIELD, id_key, load_stored_hashes, with_hash
 
-def main():
-    # 1) Load CSV
-    df = pd.read_csv("tax_records.csv")
+# This script streams tax_records.csv into Mongo in chunks instead of loading the whole file at once.
+# Every row is upserted by Customer ID, so the collection is never empty while the import runs,
+# and a checkpoint file lets a failed import pick up where it stopped.
+# With --sync it only writes the rows that actually changed since the last import (see section 5).
 
-    # 2) Connect to Atlas
+DEFAULT_CSV        = "tax_records.csv"
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_WORKERS    = 4
+DELETE_BATCH_SIZE  = 1000
+
+
+# ─── 1) CHECKPOINT HELPERS ──────────────────────────────────────────────────────
+# The checkpoint remembers how many data rows are already safely written for one specific csv file.
+# If the csv changed (size or modified time), the old checkpoint is ignored.
+def _file_signature(csv_path):
+    st = os.stat(csv_path)
+    return {"csv": os.path.abspath(csv_path), "size": st.st_size, "mtime": int(st.st_mtime)}
+
+def load_checkpoint(checkpoint_path, csv_path):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path) as f:
+        saved = json.load(f)
+    if {k: saved.get(k) for k in ("csv", "size", "mtime")} != _file_signature(csv_path):
+        return 0
+    return int(saved.get("rows_done", 0))
+
+def save_checkpoint(checkpoint_path, csv_path, rows_done):
+    if not checkpoint_path:
+        return
+    # write to a temp file first then rename, so a crash never leaves half a checkpoint behind
+    tmp = checkpoint_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({**_file_signature(csv_path), "rows_done": rows_done}, f)
+    os.replace(tmp, checkpoint_path)
+
+def clear_checkpoint(checkpoint_path):
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+
+# ─── 2) CSV STREAMING ───────────────────────────────────────────────────────────
+# Yields (first_row_number, list of record dicts). Only one chunk is parsed at a time.
+# skip_rows uses a callable so resuming past tens of millions of rows doesn't build a huge list.
+# The csv's Taxable Income / Tax Due / Refund/Balance are stored as they are - they are the customer's real
+# figures. derive=True (--derive) recomputes them with tax_engine (current TAX_RULES) instead.
+def iter_record_chunks(csv_path, chunk_size=DEFAULT_CHUNK_SIZE, skip_rows=0, derive=False):
+    skip = (lambda i: 0 < i <= skip_rows) if skip_rows else None
+    reader = pd.read_csv(csv_path, chunksize=chunk_size, skiprows=skip)
+    start = skip_rows
+    for chunk in reader:
+        if derive:
+            chunk = tax_engine.derive_fields(chunk)
+        records = chunk.to_dict("records")
+        yield start, records
+        start += len(records)
+
+
+# ─── 3) MONGO WRITES ────────────────────────────────────────────────────────────
+def ensure_key_index(coll):
+    """
+    Upserts look up every row by Customer ID, so that field needs an index.
+    Prefer a unique one; fall back to a normal index if old data already has duplicates.
+    """
+    try:
+        coll.create_index(KEY_FIELD, unique=True)
+    except OperationFailure as e:
+        print(f"⚠️ Could not create unique index on '{KEY_FIELD}' ({e}); using a non-unique index.")
+        coll.create_index(KEY_FIELD)
+
+def ensure_indexes(coll):
+    """Key index plus the Manage Records sort indexes. Built after the data is in (faster than indexing row by row)."""
+    started_at = time.monotonic()
+    ensure_key_index(coll)
+    records_query.create_indexes(coll)
+    print(f"Indexes ready in {time.monotonic() - started_at:,.1f}s")
+
+def upsert_batch(coll, records):
+    """
+    One unordered bulk_write of UpdateOne(upsert=True) per record.
+    Unordered lets the server apply the batch in parallel and keep going past a bad row.
+    """
+    ops = [
+        UpdateOne({KEY_FIELD: rec[KEY_FIELD]}, {"$set": with_hash(rec)}, upsert=True)
+        for rec in records
+    ]
+    if not ops:
+        return 0
+    coll.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+# ─── 4) IMPORT LOOP ─────────────────────────────────────────────────────────────
+def import_csv(coll, csv_path=DEFAULT_CSV, chunk_size=DEFAULT_CHUNK_SIZE, workers=DEFAULT_WORKERS,
+               checkpoint_path=None, resume=True, report_every=5.0, derive=False):
+    """
+    Streams csv_path into coll with a pool of writer threads.
+    At most workers * 2 chunks are in memory at once, so memory stays constant whatever the file size.
+    Returns the total number of rows written in this run.
+    """
+    rows_done = load_checkpoint(checkpoint_path, csv_path) if resume else 0
+    if rows_done:
+        print(f"↩️ Resuming from checkpoint: {rows_done:,} rows already imported.")
+
+    ensure_key_index(coll)
+
+    # Chunks can finish out of order, so the checkpoint only moves forward over
+    # a contiguous run of finished chunks (start row -> row count).
+    finished   = {}
+    committed  = rows_done
+    written    = 0
+    started_at = time.monotonic()
+    last_report = started_at
+
+    def _advance_checkpoint():
+        nonlocal committed
+        while committed in finished:
+            committed += finished.pop(committed)
+        save_checkpoint(checkpoint_path, csv_path, committed)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        for start, records in iter_record_chunks(csv_path, chunk_size, skip_rows=rows_done, derive=derive):
+            # Back-pressure: wait for a writer to free up before reading more of the file
+            while len(in_flight) >= workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    chunk_start = in_flight.pop(fut)
+                    finished[chunk_start] = fut.result()
+                    written += finished[chunk_start]
+                _advance_checkpoint()
+
+            in_flight[pool.submit(upsert_batch, coll, records)] = start
+
+            now = time.monotonic()
+            if now - last_report >= report_every:
+                rate = written / (now - started_at)
+                print(f"… {committed:,} rows committed ({rate:,.0f} rows/s)")
+                last_report = now
+
+        for fut in wait(in_flight).done:
+            chunk_start = in_flight.pop(fut)
+            finished[chunk_start] = fut.result()
+            written += finished[chunk_start]
+        _advance_checkpoint()
+
+    elapsed = max(time.monotonic() - started_at, 1e-9)
+    print(f"Upserted {written:,} rows in {elapsed:,.1f}s ({written / elapsed:,.0f} rows/s)")
+
+    # Whole file is in, so the next run should start from scratch
+    clear_checkpoint(checkpoint_path)
+    # The app's local snapshot (if enabled) would otherwise keep serving the old records
+    if records_snapshot.enabled():
+        records_snapshot.rebuild(coll)
+    return written
+
+
+# ─── 5) INCREMENTAL SYNC ────────────────────────────────────────────────────────
+# Nightly drops usually change only a handful of rows. Instead of rewriting everything we:
+#   a) pull just (Customer ID, Row Hash) for every stored record,
+#   b) stream the csv once and compare each row's hash with the stored one,
+#   c) write only inserts / updates, and delete the IDs that disappeared from the csv.
+# Memory is one small entry per stored ID (record_schema.load_stored_hashes) plus the set of IDs seen, never the full documents.
+
+def diff_chunk(records, stored, seen):
+    """
+    Compares one csv chunk against the stored hashes and returns (write ops, counts, changed Customer IDs).
+    Seen IDs are popped out of stored, so whatever is left at the end was deleted upstream.
+    seen holds every ID already handled in this run: a Customer ID that appears again in the csv is only
+    counted as a duplicate (the first row wins), never sent as a second insert that the unique index rejects.
+    """
+    ops = []
+    changed = []
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0}
+    for rec in records:
+        rec = with_hash(rec)
+        key = id_key(rec[KEY_FIELD])
+        if key in seen:
+            counts["duplicates"] += 1
+            continue
+        seen.add(key)
+        old = stored.pop(key, None)
+        if old is None:
+            ops.append(InsertOne(rec))
+            counts["inserted"] += 1
+        elif old[1] != rec[HASH_FIELD]:
+            ops.append(UpdateOne({KEY_FIELD: old[0]}, {"$set": rec}))
+            counts["updated"] += 1
+        else:
+            counts["unchanged"] += 1
+            continue
+        changed.append(rec[KEY_FIELD])
+    return ops, counts, changed
+
+def sync_csv(coll, csv_path=DEFAULT_CSV, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, derive=False):
+    """
+    Brings coll in line with csv_path writing only the differences.
+    With dry_run=True nothing is written; the summary shows what would happen.
+    Returns the summary dict.
+    """
+    started_at = time.monotonic()
+    if not dry_run:
+        ensure_key_index(coll)
+    stored = load_stored_hashes(coll)
+    summary = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "duplicates": 0}
+    changed = []
+    seen = set()
+
+    for _, records in iter_record_chunks(csv_path, chunk_size, derive=derive):
+        ops, counts, chunk_changed = diff_chunk(records, stored, seen)
+        changed.extend(chunk_changed)
+        for k, v in counts.items():
+            summary[k] += v
+        if ops and not dry_run:
+            coll.bulk_write(ops, ordered=False)
+
+    # Anything never seen in the csv is gone upstream
+    leftover = [orig_id for orig_id, _ in stored.values()]
+    summary["deleted"] = len(leftover)
+    if not dry_run:
+        for i in range(0, len(leftover), DELETE_BATCH_SIZE):
+            coll.bulk_write([DeleteMany({KEY_FIELD: {"$in": leftover[i:i + DELETE_BATCH_SIZE]}})])
+        # only the changed IDs go to the app's local snapshot (it rebuilds by itself if that's a lot of them)
+        if records_snapshot.enabled() and (changed or leftover):
+            records_snapshot.apply_changes(coll, changed + leftover)
+
+    elapsed = time.monotonic() - started_at
+    label = "Dry run - would apply" if dry_run else "Sync applied"
+    print(
+        f"{label}: {summary['inserted']:,} inserts, {summary['updated']:,} updates, "
+        f"{summary['deleted']:,} deletes ({summary['unchanged']:,} unchanged) in {elapsed:,.1f}s"
+    )
+    if summary["duplicates"]:
+        print(f"⚠️ {summary['duplicates']:,} rows repeat a Customer ID earlier in the csv and were skipped (first row wins).")
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a tax records CSV into MongoDB.")
+    parser.add_argument("--csv", default=DEFAULT_CSV, help="CSV file to import")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per bulk_write batch")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="parallel writer threads")
+    parser.add_argument("--checkpoint", default=None,
+                        help="checkpoint file (default: <csv>.checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start from row 0")
+    parser.add_argument("--sync", action="store_true",
+                        help="incremental mode: only write inserts/updates/deletes compared to what is stored")
+    parser.add_argument("--dry-run", action="store_true", help="with --sync, print the change summary without writing")
+    parser.add_argument("--derive", action="store_true",
+                        help="recompute Taxable Income / Tax Due / Refund/Balance with TAX_RULES instead of using the csv's")
+    parser.add_argument("--indexes-only", action="store_true",
+                        help="only create the Customer ID and Manage Records sort indexes, import nothing")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Connect to Atlas
     load_dotenv()
     mongo_uri  = os.environ["MONGO_URI"]
     db_name    = os.environ["MONGO_DB"]
@@ -17,14 +280,28 @@ def main():
     db = client[db_name]
     coll = db[coll_name]
 
-    # 3) Wipe existing documents (optional)
-    coll.delete_many({})
+    if args.indexes_only:
+        ensure_indexes(coll)
+        return
 
-    # 4) Insert all rows
-    records = df.to_dict("records")
-    result = coll.insert_many(records)
+    if args.sync:
+        sync_csv(coll, csv_path=args.csv, chunk_size=args.chunk_size, dry_run=args.dry_run, derive=args.derive)
+        if not args.dry_run:
+            ensure_indexes(coll)
+        return
 
-    print(f"Imported {len(result.inserted_ids)} documents into {db_name}.{coll_name}")
+    checkpoint = args.checkpoint or args.csv + ".checkpoint.json"
+    import_csv(
+        coll,
+        csv_path=args.csv,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        checkpoint_path=checkpoint,
+        resume=not args.restart,
+        derive=args.derive,
+    )
+    ensure_indexes(coll)
+    print(f"Import into {db_name}.{coll_name} finished")
 
 if __name__ == "__main__":
     main()
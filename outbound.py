@@ -0,0 +1,172 @@
+# Shared layer for every outbound API call (OpenAI chat / TTS / Whisper, Tavily search).
+#
+# Bursts of sessions used to hit provider rate limits and fail. Each call now goes through call(), which adds:
+#   • a token-bucket limiter per provider  -> we pace ourselves instead of getting 429s
+#   • retries with jittered exponential backoff for rate-limit / timeout / 5xx errors
+#   • single-flight coalescing             -> identical in-flight requests (same key) share one result
+#   • optional hedging                     -> if an attempt is slower than hedge_after seconds, fire a second
+#                                             one and take whichever finishes first (costs an extra call)
+#
+# Limits come from .env, e.g. OPENAI_RPS=5, OPENAI_BURST=10, TAVILY_RPS=2, OPENAI_HEDGE_AFTER=8.
+
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger("gaia.outbound")
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = ("RateLimit", "Timeout", "Connection", "InternalServer", "ServiceUnavailable")
+
+
+# ─── 1) TOKEN BUCKET ────────────────────────────────────────────────────────────
+class TokenBucket:
+    """rate tokens per second, up to capacity saved up for bursts. acquire() blocks until a token is free."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+
+# ─── 2) SINGLE-FLIGHT ───────────────────────────────────────────────────────────
+class SingleFlight:
+    """do(key, fn): the first caller for a key runs fn; callers arriving meanwhile wait and get the same result."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {"done": threading.Event(), "result": None, "error": None}
+        if not leader:
+            call["done"].wait()
+            logger.info("outbound: coalesced duplicate request %r", key)
+        else:
+            try:
+                call["result"] = fn()
+            except BaseException as e:
+                call["error"] = e
+            finally:
+                with self.lock:
+                    self.calls.pop(key, None)
+                call["done"].set()
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+
+
+# ─── 3) RETRIES + HEDGING ───────────────────────────────────────────────────────
+def is_retryable(exc):
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status in RETRYABLE_STATUS:
+        return True
+    return any(part in type(exc).__name__ for part in RETRYABLE_NAMES)
+
+def backoff_delay(attempt, base=0.5, cap=20.0):
+    """Full jitter: random between 0 and base * 2**attempt (capped), so retries from many sessions spread out."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gaia-hedge")
+
+def _hedged(fn, hedge_after):
+    primary = _hedge_pool.submit(fn)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+    logger.info("outbound: attempt slower than %.1fs, sending hedge request", hedge_after)
+    pending = {primary, _hedge_pool.submit(fn)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                return fut.result()
+            error = fut.exception()
+    raise error
+
+
+# ─── 4) PROVIDERS ───────────────────────────────────────────────────────────────
+class Provider:
+    def __init__(self, name, rate, burst, retries=4, hedge_after=None):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self.flights = SingleFlight()
+
+    def _attempt(self, fn):
+        self.bucket.acquire()
+        return fn()
+
+    def _with_retries(self, fn, hedge_after):
+        attempt_fn = (lambda: _hedged(lambda: self._attempt(fn), hedge_after)) if hedge_after else (lambda: self._attempt(fn))
+        for attempt in range(self.retries + 1):
+            try:
+                return attempt_fn()
+            except Exception as e:
+                if attempt == self.retries or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning("outbound: %s call failed (%s), retry %d in %.1fs", self.name, e, attempt + 1, delay)
+                time.sleep(delay)
+
+    def call(self, fn, key=None, hedge=False):
+        """
+        Runs fn() through the limiter, retries and (optionally) hedging.
+        key: requests with the same key that overlap in time share one call. None = no coalescing.
+        hedge: allow a hedge request if this provider has hedge_after configured.
+        fn must be safe to run more than once (retries / hedges) - e.g. rewind or rebuild file objects inside it.
+        """
+        hedge_after = self.hedge_after if hedge else None
+        run = lambda: self._with_retries(fn, hedge_after)
+        if key is None:
+            return run()
+        return self.flights.do(key, run)
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+PROVIDERS = {
+    "openai": Provider(
+        "openai",
+        rate=_env_float("OPENAI_RPS", 5),
+        burst=_env_float("OPENAI_BURST", 10),
+        hedge_after=_env_float("OPENAI_HEDGE_AFTER", None),
+    ),
+    "tavily": Provider(
+        "tavily",
+        rate=_env_float("TAVILY_RPS", 2),
+        burst=_env_float("TAVILY_BURST", 4),
+        hedge_after=_env_float("TAVILY_HEDGE_AFTER", None),
+    ),
+}
+
+def call(provider, fn, key=None, hedge=False):
+    """outbound.call("openai", lambda: client.audio.speech.create(...), key=("tts", voice, text))"""
+    return PROVIDERS[provider].call(fn, key=key, hedge=hedge)
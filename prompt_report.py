@@ -0,0 +1,81 @@
+# Offline token report for everything GAIA sends on every agent call:
+# the static system prompt, the dynamic tail (today's date) and each tool's JSON schema.
+# No API calls are made; tokens are counted with tiktoken (the tokenizer gpt-4o-mini uses).
+#
+#   python prompt_report.py                 -> table of token cost per component
+#   python prompt_report.py --budget 900    -> same, but exit with an error if the per-call total is above 900
+#
+# Handy before shipping a prompt/docstring change: run it on both branches and compare.
+
+import argparse
+import json
+import sys
+
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from prompts import STATIC_SYSTEM_PROMPT, dynamic_prompt_tail
+from agent_tools import (
+    verify_user_tool,
+    search_tool,
+    query_personal_tax_info_tool,
+    create_booking_tool,
+    update_booking_tool
+)
+
+TOOLS = [
+    search_tool,
+    query_personal_tax_info_tool,
+    verify_user_tool,
+    create_booking_tool,
+    update_booking_tool
+]
+ENCODING = "o200k_base"     # gpt-4o / gpt-4o-mini
+
+
+def get_counter():
+    """Returns (count_tokens function, is_exact). Falls back to ~4 characters per token without tiktoken."""
+    try:
+        import tiktoken
+    except ImportError:
+        return (lambda text: max(1, len(text) // 4)), False
+    enc = tiktoken.get_encoding(ENCODING)
+    return (lambda text: len(enc.encode(text))), True
+
+
+def components():
+    """[(name, text, cacheable)] in the order they appear in a request."""
+    parts = []
+    for t in TOOLS:
+        schema = json.dumps(convert_to_openai_tool(t), separators=(",", ":"))
+        parts.append((f"tool: {t.name}", schema, True))
+    parts.append(("system prompt (static)", STATIC_SYSTEM_PROMPT, True))
+    parts.append(("system prompt (dynamic tail)", dynamic_prompt_tail(), False))
+    return parts
+
+
+def report(budget=None):
+    count, exact = get_counter()
+    rows = [(name, count(text), cacheable) for name, text, cacheable in components()]
+    total = sum(n for _, n, _ in rows)
+    cached = sum(n for _, n, c in rows if c)
+
+    width = max(len(name) for name, _, _ in rows)
+    print(f"{'component':<{width}}  tokens  cacheable")
+    for name, n, cacheable in rows:
+        print(f"{name:<{width}}  {n:>6}  {'yes' if cacheable else 'no'}")
+    print(f"{'total per call':<{width}}  {total:>6}")
+    print(f"{'stable prefix':<{width}}  {cached:>6}  ({cached / total:.0%} of the fixed cost)")
+    if not exact:
+        print("(tiktoken not installed - numbers are estimates)")
+
+    if budget is not None and total > budget:
+        print(f"❌ {total} tokens per call is over the budget of {budget}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Token cost per component of every agent call.")
+    parser.add_argument("--budget", type=int, default=None, help="fail if the per-call total exceeds this")
+    args = parser.parse_args()
+    sys.exit(report(args.budget))
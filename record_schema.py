@@ -0,0 +1,67 @@
+# Shape of a tax record, shared by every module that reads or writes the collection
+# (app.py, import_tax_records.py, records_query.py, records_snapshot.py, tax_engine.py, agent_tools.py).
+#
+#   • field names
+#   • the Row Hash (content hash the incremental csv sync compares against)
+#   • Customer ID matching: ids from the csv are stored as ints, ids from the Add Record form as strings
+
+import hashlib
+import json
+
+KEY_FIELD      = "Customer ID"
+NAME_FIELD     = "Full Name"
+HASH_FIELD     = "Row Hash"
+INPUT_FIELDS   = ["Total Income", "Deductions", "Tax Paid"]
+DERIVED_FIELDS = ["Taxable Income", "Tax Due", "Refund/Balance"]
+
+
+# ─── 1) CUSTOMER IDS ────────────────────────────────────────────────────────────
+def id_key(customer_id):
+    """Customer ID as a plain string, for dict keys and comparisons ('100123' and 100123 are the same customer)."""
+    return str(customer_id if customer_id is not None else "").strip()
+
+def id_variants(customer_id):
+    """Every stored form of a Customer ID, for {KEY_FIELD: {"$in": id_variants(x)}} queries."""
+    key = id_key(customer_id)
+    variants = [key]
+    if key.isdigit():
+        variants.append(int(key))
+    return variants
+
+
+# ─── 2) ROW HASH ────────────────────────────────────────────────────────────────
+# Content hash of one record: every field except _id, the hash itself and the derived fields.
+# Derived fields are left out because they follow from the inputs plus the tax rules (tax_engine.py):
+# a "Recompute all" changes them on the server without making every row look changed to the next csv sync.
+# Whole-number floats are turned into ints first, so 8600 from the csv and 8600.0 from a form hash the same.
+def _normalize_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if hasattr(value, "item"):          # numpy scalars -> plain python
+        return _normalize_value(value.item())
+    return value
+
+_NOT_HASHED = {"_id", HASH_FIELD, *DERIVED_FIELDS}
+
+def record_hash(record):
+    clean = {
+        k: _normalize_value(v)
+        for k, v in record.items()
+        if k not in _NOT_HASHED
+    }
+    payload = json.dumps(clean, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def with_hash(record):
+    """Returns a copy of record with its Row Hash filled in (used by every writer, including app.py)."""
+    rec = {k: v for k, v in record.items() if k != HASH_FIELD}
+    rec[HASH_FIELD] = record_hash(rec)
+    return rec
+
+def load_stored_hashes(coll):
+    """{id string: (Customer ID as stored, Row Hash)} for every record. Only those two fields are read."""
+    stored = {}
+    for doc in coll.find({}, {KEY_FIELD: 1, HASH_FIELD: 1, "_id": 0}):
+        if KEY_FIELD in doc:
+            stored[id_key(doc[KEY_FIELD])] = (doc[KEY_FIELD], doc.get(HASH_FIELD))
+    return stored
@@ -0,0 +1,133 @@
+# Query layer for the admin "Manage Records" page.
+# Instead of pulling the whole collection into pandas, every call here only fetches the rows on screen:
+#   • cursor (keyset) pagination - "give me the next N after this row", no skip() over thousands of docs
+#   • indexed search by name prefix or exact Customer ID
+#   • sorting on any record column
+#   • cheap count estimates for the page header
+
+import re
+
+import pandas as pd
+from pymongo import ASCENDING, DESCENDING
+
+from record_schema import KEY_FIELD, NAME_FIELD, HASH_FIELD, id_variants
+
+# Columns the admin can sort by; each gets a (column, _id) index so sorted pages come straight off the index
+# (built by `python import_tax_records.py`, see create_indexes)
+SORTABLE_FIELDS = [
+    NAME_FIELD,
+    KEY_FIELD,
+    "Total Income",
+    "Deductions",
+    "Taxable Income",
+    "Tax Due",
+    "Tax Paid",
+    "Refund/Balance",
+]
+DEFAULT_PAGE_SIZE = 25
+COUNT_LIMIT = 10_000     # stop counting search matches after this many; the UI shows "10,000+"
+
+# Never send these to the UI (the row hash only matters to the csv sync)
+_PROJECTION = {HASH_FIELD: 0}
+
+
+# ─── 1) INDEXES ─────────────────────────────────────────────────────────────────
+def create_indexes(coll):
+    """
+    Creates the (column, _id) sort indexes. Slow on a big collection, so it is run by the importer
+    (or `python import_tax_records.py --indexes-only`), never from the app.
+    The plain Customer ID index belongs to import_tax_records.ensure_key_index (unique where possible).
+    """
+    for field in SORTABLE_FIELDS:
+        coll.create_index([(field, ASCENDING), ("_id", ASCENDING)])
+
+
+# ─── 2) FILTERS ─────────────────────────────────────────────────────────────────
+def build_search_filter(search=""):
+    """
+    Empty search -> everything.
+    Otherwise match an exact Customer ID, or a Full Name starting with the text.
+    Anchored regexes ("^Jim") can use the Full Name index; we try the text as typed and Title Cased.
+    """
+    search = (search or "").strip()
+    if not search:
+        return {}
+    prefixes = {search, search.title()}
+    name_patterns = [re.compile("^" + re.escape(p)) for p in prefixes]
+    return {"$or": [
+        {KEY_FIELD: {"$in": id_variants(search)}},
+        {NAME_FIELD: {"$in": name_patterns}},
+    ]}
+
+
+def _after_filter(sort_field, ascending, cursor):
+    """
+    Keyset condition for "rows after cursor" in the current sort order.
+    cursor is (sort value, _id) of the last row on the previous page; _id breaks ties.
+    """
+    value, last_id = cursor
+    op = "$gt" if ascending else "$lt"
+    clauses = [
+        {sort_field: {op: value}},
+        {sort_field: value, "_id": {op: last_id}},
+    ]
+    # Mongo only compares values of the same type with $gt/$lt, and sorts numbers before strings.
+    # Customer ID holds both, so once we pass the last number (ascending) the strings still have to come.
+    if ascending and isinstance(value, (int, float)):
+        clauses.append({sort_field: {"$type": "string"}})
+    if not ascending and isinstance(value, str):
+        clauses.append({sort_field: {"$type": "number"}})
+    return {"$or": clauses}
+
+
+# ─── 3) PAGES, COUNTS, SINGLE RECORDS ───────────────────────────────────────────
+def fetch_page(coll, search="", sort_field=NAME_FIELD, ascending=True, cursor=None,
+               page_size=DEFAULT_PAGE_SIZE):
+    """
+    Returns (DataFrame of at most page_size rows, cursor for the next page or None).
+    Pass the returned cursor back in to get the following page.
+    """
+    if sort_field not in SORTABLE_FIELDS:
+        raise ValueError(f"Cannot sort by {sort_field!r}")
+
+    query = build_search_filter(search)
+    if cursor is not None:
+        after = _after_filter(sort_field, ascending, cursor)
+        query = {"$and": [query, after]} if query else after
+
+    direction = ASCENDING if ascending else DESCENDING
+    # Ask for one extra row to know if there is a next page without a separate count
+    docs = list(
+        coll.find(query, _PROJECTION)
+            .sort([(sort_field, direction), ("_id", direction)])
+            .limit(page_size + 1)
+    )
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+
+    next_cursor = None
+    if has_more and docs:
+        last = docs[-1]
+        next_cursor = (last.get(sort_field), last["_id"])
+
+    for d in docs:
+        d.pop("_id", None)
+    return pd.DataFrame(docs), next_cursor
+
+
+def estimate_count(coll, search=""):
+    """
+    Returns (count, is_capped).
+    Without a search this is the collection metadata count (no scan).
+    With a search we count through the index but stop at COUNT_LIMIT.
+    """
+    query = build_search_filter(search)
+    if not query:
+        return coll.estimated_document_count(), False
+    n = coll.count_documents(query, limit=COUNT_LIMIT)
+    return n, n >= COUNT_LIMIT
+
+
+def get_record(coll, customer_id):
+    """Single record by Customer ID (string or int), or None."""
+    return coll.find_one({KEY_FIELD: {"$in": id_variants(customer_id)}}, {"_id": 0, HASH_FIELD: 0})
@@ -0,0 +1,334 @@
+# Optional read replica of the tax records collection, stored on local disk as NumPy columns.
+#
+# Almost everything the app does with tax records is a read (verify user, personal queries, admin browsing),
+# so instead of asking Mongo every time we keep a columnar snapshot:
+#   • one .npy file per column, opened with mmap_mode="r" -> every worker process shares the same OS page cache
+#   • a prebuilt open-addressing hash table (also .npy) for O(1) lookup by Customer ID
+#   • single-record writes are not a rebuild: apply_changes() fetches just those records and appends them to
+#     the version's delta.jsonl. Readers keep an overlay {id: record or None (deleted)} on top of the columns
+#     and read only the new lines of the log. Once the overlay is big enough, compact() folds it into a new version.
+#   • bulk writers (importer, --sync, "Recompute all") call rebuild() / apply_changes() themselves when done
+#
+# Turn it on by setting TAX_SNAPSHOT_DIR in .env (e.g. TAX_SNAPSHOT_DIR=.snapshot/tax_records).
+# Without it the app reads straight from Mongo as before.
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from record_schema import KEY_FIELD, HASH_FIELD, id_key, id_variants
+
+try:
+    import fcntl
+except ImportError:         # Windows: only one process writes, a thread lock is enough
+    fcntl = None
+
+load_dotenv()
+SNAPSHOT_DIR = os.environ.get("TAX_SNAPSHOT_DIR", "")
+
+_EMPTY = -1
+_KEEP_VERSIONS = 2
+_FETCH_BATCH = 1000
+COMPACT_MIN = 1000          # compact once the overlay holds this many records...
+COMPACT_FRACTION = 0.05     # ...or this share of the snapshot, whichever is bigger
+DELTA_FILE = "delta.jsonl"
+
+
+def enabled():
+    return bool(SNAPSHOT_DIR)
+
+
+# ─── 1) HASH INDEX ──────────────────────────────────────────────────────────────
+def _key_hash(customer_id):
+    digest = hashlib.blake2b(id_key(customer_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+def build_index(keys):
+    """
+    Linear-probing hash table over the Customer ID column.
+    Table size is a power of two at least 2x the row count, so probes stay short.
+    Probing is done for all keys at once: each round, every key still looking for a slot tries its next one
+    and the lowest row wins a contested slot. Number of rounds = longest probe, usually a handful.
+    Returns (slot_hashes uint64, slot_rows int64) - both saved as .npy and memory-mapped later.
+    """
+    size = 1
+    while size < max(2 * len(keys), 8):
+        size *= 2
+    slot_hashes = np.zeros(size, dtype=np.uint64)
+    slot_rows = np.full(size, _EMPTY, dtype=np.int64)
+    hashes = np.fromiter((_key_hash(k) for k in keys), dtype=np.uint64, count=len(keys))
+
+    rows = np.arange(len(keys), dtype=np.int64)
+    slots = (hashes & np.uint64(size - 1)).astype(np.int64)
+    while rows.size:
+        # among keys aiming at the same free slot, the lowest row takes it
+        order = np.lexsort((rows, slots))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = slots[order][1:] != slots[order][:-1]
+        winners = order[first & (slot_rows[slots[order]] == _EMPTY)]
+        slot_rows[slots[winners]] = rows[winners]
+        slot_hashes[slots[winners]] = hashes[rows[winners]]
+        waiting = np.ones(rows.size, dtype=bool)
+        waiting[winners] = False
+        rows, slots = rows[waiting], (slots[waiting] + 1) & (size - 1)
+    return slot_hashes, slot_rows
+
+
+# ─── 2) READING A SNAPSHOT ──────────────────────────────────────────────────────
+class Snapshot:
+    """One memory-mapped snapshot version plus the overlay from its delta log."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.columns = {
+            name: np.load(os.path.join(path, f"col_{i}.npy"), mmap_mode="r")
+            for i, name in enumerate(self.meta["columns"])
+        }
+        # Customer IDs are ints (csv) or strings (Add Record form); this remembers which
+        self.key_is_int = np.load(os.path.join(path, "key_is_int.npy"), mmap_mode="r")
+        self.slot_hashes = np.load(os.path.join(path, "index_hashes.npy"), mmap_mode="r")
+        self.slot_rows = np.load(os.path.join(path, "index_rows.npy"), mmap_mode="r")
+        self.overlay = {}           # id string -> record dict, or None when deleted
+        self.shadowed = set()       # overlay ids that also have a (now outdated) row in the columns
+        self.delta_pos = 0          # bytes of delta.jsonl already applied
+        self.sync_delta()
+
+    def __len__(self):
+        live = sum(rec is not None for rec in self.overlay.values())
+        return self.meta["rows"] - len(self.shadowed) + live
+
+    def sync_delta(self):
+        """Applies lines appended to delta.jsonl since the last call. Just one stat() when nothing changed."""
+        path = os.path.join(self.path, DELTA_FILE)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        if size <= self.delta_pos:
+            return
+        with open(path, "rb") as f:
+            f.seek(self.delta_pos)
+            data = f.read(size - self.delta_pos)
+        end = data.rfind(b"\n") + 1          # a line still being written is picked up next time
+        for line in data[:end].splitlines():
+            entry = json.loads(line)
+            key = entry["key"]
+            self.overlay[key] = entry["record"]
+            if self._row_of(key) is not None:
+                self.shadowed.add(key)
+        self.delta_pos += end
+
+    def _row_of(self, customer_id):
+        key = id_key(customer_id)
+        h = _key_hash(key)
+        mask = len(self.slot_rows) - 1
+        slot = h & mask
+        keys = self.columns[KEY_FIELD]
+        while True:
+            row = int(self.slot_rows[slot])
+            if row == _EMPTY:
+                return None
+            if int(self.slot_hashes[slot]) == h and keys[row] == key:
+                return row
+            slot = (slot + 1) & mask
+
+    def _record_at(self, row):
+        rec = {}
+        for name, col in self.columns.items():
+            value = col[row].item()
+            if isinstance(value, float):
+                if np.isnan(value):
+                    continue
+                if value.is_integer():
+                    value = int(value)
+            rec[name] = value
+        if self.key_is_int[row]:
+            rec[KEY_FIELD] = int(rec[KEY_FIELD])
+        rec.pop(HASH_FIELD, None)
+        return rec
+
+    def lookup(self, customer_id):
+        """Record dict for a Customer ID (string or int) or None. O(1): overlay dict, else one hash and a few probes."""
+        key = id_key(customer_id)
+        if key in self.overlay:
+            rec = self.overlay[key]
+            return None if rec is None else dict(rec)
+        row = self._row_of(key)
+        return None if row is None else self._record_at(row)
+
+    def to_dataframe(self):
+        data = {name: np.asarray(col) for name, col in self.columns.items() if name != HASH_FIELD}
+        df = pd.DataFrame(data)
+        if len(df):
+            is_int = np.asarray(self.key_is_int)
+            if self.shadowed:
+                keep = ~np.isin(df[KEY_FIELD].to_numpy(), list(self.shadowed))
+                df, is_int = df[keep].reset_index(drop=True), is_int[keep]
+            df[KEY_FIELD] = [int(k) if flag else k for k, flag in zip(df[KEY_FIELD], is_int)]
+        live = [rec for rec in self.overlay.values() if rec is not None]
+        if live:
+            df = pd.concat([df, pd.DataFrame(live)], ignore_index=True)
+        return df
+
+
+# Each process keeps the currently open version; a cheap read of CURRENT tells us if a newer one exists
+_open = {"version": None, "snapshot": None}
+
+def current_version():
+    """Name of the published snapshot version (None if disabled / not built yet)."""
+    if not enabled():
+        return None
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, "CURRENT")) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def open_snapshot():
+    """Latest snapshot with its delta log applied, or None if disabled / not built yet."""
+    if not enabled():
+        return None
+    version = current_version()
+    if version is None:
+        return None
+    if _open["version"] != version:
+        _open["snapshot"] = Snapshot(os.path.join(SNAPSHOT_DIR, version))
+        _open["version"] = version
+    else:
+        _open["snapshot"].sync_delta()
+    return _open["snapshot"]
+
+
+# ─── 3) WRITING A SNAPSHOT ──────────────────────────────────────────────────────
+# Writers in every process (app, importer, tax_engine CLI) take this lock, so a compaction can't
+# drop a delta line that was appended to the version it is replacing.
+_thread_lock = threading.Lock()
+
+@contextlib.contextmanager
+def _write_lock():
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with _thread_lock, open(os.path.join(SNAPSHOT_DIR, ".lock"), "w") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+def _to_column(series):
+    # int -> int64, numeric -> float64 (missing = NaN), anything else -> fixed-width unicode
+    if pd.api.types.is_bool_dtype(series):
+        return series.astype(str).to_numpy(dtype=str)
+    if pd.api.types.is_integer_dtype(series) or pd.api.types.is_float_dtype(series):
+        return series.to_numpy()
+    numeric = pd.to_numeric(series, errors="coerce")
+    if numeric.notna().sum() == series.notna().sum() and not series.map(lambda v: isinstance(v, str)).any():
+        return numeric.to_numpy(dtype=np.float64)
+    return series.fillna("").astype(str).to_numpy(dtype=str)
+
+def write_snapshot(records):
+    """Writes records (DataFrame or list of dicts) as a new version and points CURRENT at it. Returns the version name."""
+    df = records if isinstance(records, pd.DataFrame) else pd.DataFrame(list(records))
+    df = df.drop(columns=[c for c in ("_id", HASH_FIELD) if c in df.columns])
+    if KEY_FIELD not in df.columns:
+        df.insert(0, KEY_FIELD, pd.Series([], dtype=object))
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    version = f"v{time.time_ns()}"
+    tmp_path = os.path.join(SNAPSHOT_DIR, version + ".tmp")
+    os.makedirs(tmp_path)
+
+    names = list(df.columns)
+    ids = df[KEY_FIELD].tolist()
+    keys = [id_key(k) for k in ids]
+    for i, name in enumerate(names):
+        col = np.array(keys, dtype=str) if name == KEY_FIELD else _to_column(df[name])
+        np.save(os.path.join(tmp_path, f"col_{i}.npy"), col)
+    np.save(os.path.join(tmp_path, "key_is_int.npy"),
+            np.array([isinstance(k, (int, np.integer)) for k in ids], dtype=bool))
+    slot_hashes, slot_rows = build_index(keys)
+    np.save(os.path.join(tmp_path, "index_hashes.npy"), slot_hashes)
+    np.save(os.path.join(tmp_path, "index_rows.npy"), slot_rows)
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({"columns": names, "rows": len(df), "built_at": time.time()}, f)
+
+    # Publish: rename the finished directory, then swap CURRENT atomically
+    final_path = os.path.join(SNAPSHOT_DIR, version)
+    os.replace(tmp_path, final_path)
+    current_tmp = os.path.join(SNAPSHOT_DIR, "CURRENT.tmp")
+    with open(current_tmp, "w") as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(SNAPSHOT_DIR, "CURRENT"))
+    _prune_old_versions(keep=version)
+    return version
+
+def _prune_old_versions(keep):
+    # Processes that still have an old version mapped keep working (unlinked files stay readable on POSIX)
+    versions = sorted(d for d in os.listdir(SNAPSHOT_DIR) if d.startswith("v") and not d.endswith(".tmp"))
+    for old in versions[:-_KEEP_VERSIONS]:
+        if old != keep:
+            shutil.rmtree(os.path.join(SNAPSHOT_DIR, old), ignore_errors=True)
+
+
+# ─── 4) BUILD / INCREMENTAL UPDATES FROM MONGO ──────────────────────────────────
+def rebuild(coll):
+    """Full rebuild from the collection (bulk imports, Recompute all, first build)."""
+    with _write_lock():
+        return write_snapshot(pd.DataFrame(list(coll.find({}, {"_id": 0, HASH_FIELD: 0}))))
+
+def compact():
+    """Folds the delta overlay into a new version (columns and hash index rebuilt once for all the changes)."""
+    with _write_lock():
+        snap = open_snapshot()
+        if snap is None or not snap.overlay:
+            return current_version()
+        return write_snapshot(snap.to_dataframe())
+
+def _compact_threshold(snap):
+    return max(COMPACT_MIN, int(COMPACT_FRACTION * snap.meta["rows"]))
+
+def apply_changes(coll, customer_ids):
+    """
+    Updates the snapshot after writes to these Customer IDs (added, edited or deleted).
+    Only those records are fetched and appended to the delta log - no scan of the collection.
+    Large change sets go straight to a rebuild. Returns the snapshot version.
+    """
+    keys = list(dict.fromkeys(id_key(c) for c in customer_ids if id_key(c)))
+    snap = open_snapshot()
+    if snap is None or len(keys) > _compact_threshold(snap):
+        return rebuild(coll)
+    if not keys:
+        return current_version()
+
+    found = {}
+    for i in range(0, len(keys), _FETCH_BATCH):
+        variants = [v for k in keys[i:i + _FETCH_BATCH] for v in id_variants(k)]
+        for doc in coll.find({KEY_FIELD: {"$in": variants}}, {"_id": 0, HASH_FIELD: 0}):
+            found[id_key(doc[KEY_FIELD])] = doc
+    lines = "".join(json.dumps({"key": k, "record": found.get(k)}, default=str) + "\n" for k in keys)
+
+    with _write_lock():
+        # append to whatever version is current now (a compaction may have just published a new one)
+        version = current_version()
+        with open(os.path.join(SNAPSHOT_DIR, version, DELTA_FILE), "a", encoding="utf-8") as f:
+            f.write(lines)
+    snap = open_snapshot()
+    if len(snap.overlay) > _compact_threshold(snap):
+        return compact()
+    return version
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+    SNAPSHOT_DIR = SNAPSHOT_DIR or ".snapshot/tax_records"
+    coll = MongoClient(os.environ["MONGO_URI"])[os.environ["MONGO_DB"]][os.environ["MONGO_COLL"]]
+    started = time.monotonic()
+    version = rebuild(coll)
+    print(f"Snapshot {version} ready ({len(open_snapshot()):,} records) in {time.monotonic() - started:,.1f}s")
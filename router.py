@@ -0,0 +1,320 @@
+# Cheap local routing in front of the LLM agent.
+#
+# Two kinds of messages are predictable enough that a full ReAct turn is wasted on them:
+#   1) the first "my name is X, id Y" message  -> always ends in verify_user, so we call it directly
+#   2) clearly off-topic requests              -> the system prompt refuses them anyway, so we reply with the refusal
+# Everything else goes to the agent as before. Each decision is logged, with a running count of LLM calls saved.
+#
+# The off-topic check is a tiny TF-IDF + logistic regression model trained in NumPy on the examples below
+# (a fraction of a second, once per process). It only refuses when it is very confident; anything borderline reaches the agent.
+# Before the model runs, an in-scope guard sends anything mentioning taxes, bookings or a Canadian place
+# straight to the agent - a refused real question costs far more than one saved LLM call.
+# `python router.py` checks the routing against the held-out examples at the bottom of this file.
+
+import logging
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+logger = logging.getLogger("gaia.router")
+
+REFUSAL_REPLY = (
+    "Sorry, I can only help with your tax record, Canada's taxes and attractions, "
+    "and booking a meeting with Mr. Gian. Is there anything like that I can do for you?"
+)
+OFF_TOPIC_THRESHOLD = 0.85
+MIN_HELD_OUT_REFUSAL = 0.6     # `python router.py` fails if fewer held-out off-topic examples are refused locally
+
+
+# ─── 1) CREDENTIAL EXTRACTION ───────────────────────────────────────────────────
+# Accepts things like "Dwight Schrute 112345", "Hi, my name is Jim Halpert and my id is 104567",
+# "I'm Pam Beesly, customer ID: 109876". The whole message has to be credentials, nothing else.
+# The ID must look like one of ours: 5-10 digits (csv import) or the 8 hex characters the Add Record form
+# generates (with at least one digit), so "Things to do in Whistler 2025" or "book meeting friday 1230" don't match.
+_CREDENTIALS = re.compile(
+    r"""^\s*
+    (?:(?:hi|hello|hey)(?:\s+gaia)?[\s,!.]*)?
+    (?:(?:my\s+(?:full\s+)?name\s+is|name\s*:|i\s+am|i'm|im|this\s+is)\s+)?
+    (?P<name>[^\W\d_][^\W\d_'.\-]*(?:[\s'.\-]+[^\W\d_][^\W\d_'.\-]*){1,4}?)
+    [\s,;.]*
+    (?:(?:and\s+)?(?:my\s+)?(?:customer\s+)?id(?:\s+is|\s*:|\s*\#)?\s*)?
+    (?P<id>\d{5,10}|[0-9a-f]{8})
+    \s*[.!]?\s*$""",
+    re.IGNORECASE | re.VERBOSE,
+)
+_NAME_NOISE = {"and", "my", "id", "customer", "is", "name"}
+# Words that make the "name" part a sentence rather than a name
+_NOT_NAME_WORDS = {
+    # prepositions / articles / pronouns
+    "to", "in", "on", "at", "for", "with", "from", "near", "about", "of", "into", "by", "the", "a", "an",
+    "me", "i", "you", "we", "it", "this", "that", "what", "when", "where", "how", "why", "who", "which",
+    # verbs people start requests with
+    "do", "does", "is", "are", "was", "book", "booking", "schedule", "reschedule", "cancel", "move", "meet",
+    "meeting", "show", "tell", "find", "get", "give", "list", "check", "pay", "file", "owe", "see", "visit",
+    "want", "need", "can", "could", "please", "things", "thing", "best", "top",
+    # dates
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday", "today", "tomorrow",
+    "january", "february", "march", "april", "june", "july", "august", "september", "october",
+    "november", "december", "am", "pm",
+}
+
+def extract_credentials(text):
+    """Returns (name, customer_id) when the message is just a name and an ID, else None."""
+    m = _CREDENTIALS.match(text or "")
+    if not m:
+        return None
+    name, cid = m.group("name").strip(" .,-'"), m.group("id")
+    words = [w.lower() for w in re.split(r"[\s'.\-]+", name) if w]
+    if not any(ch.isdigit() for ch in cid):
+        return None
+    if any(w in _NAME_NOISE or w in _NOT_NAME_WORDS for w in words):
+        return None
+    return name, cid
+
+
+# ─── 2) IN-SCOPE GUARD ──────────────────────────────────────────────────────────
+# Any of these words means the question is (or may be) ours, whatever the classifier thinks.
+_IN_SCOPE_TERMS = [
+    # taxes
+    r"tax(?:es|ed|ing|able)?", "cra", "rrsp", "tfsa", "fhsa", "resp", "rdsp", "gst", "hst", "pst", "qst",
+    "first home savings", "savings account", "refund", "deductions?", "deductible", "credits?", "income",
+    "capital gains?", "dividends?", "t4", "t5", "notice of assessment", "benefits?", "pension", "cpp", "ei",
+    "filing", "file", "accountant", "accounting", "bookkeep\\w*", "rental property", "self[ -]employed",
+    # bookings
+    "book", "booking", "meeting", "appointment", "consultation", "schedule", "reschedule", "gian", "gaia",
+    # Canada, provinces and territories
+    "canada", "canadian", "british columbia", "alberta", "saskatchewan", "manitoba", "ontario", "quebec",
+    "new brunswick", "nova scotia", "prince edward island", "newfoundland", "labrador", "yukon",
+    "northwest territories", "nunavut", "maritimes",
+    # cities and towns
+    "vancouver", "victoria", "whistler", "kelowna", "tofino", "squamish", "calgary", "edmonton", "banff",
+    "jasper", "canmore", "regina", "saskatoon", "winnipeg", "churchill", "toronto", "ottawa", "niagara",
+    "mississauga", "muskoka", "montreal", "gatineau", "halifax", "fredericton", "moncton", "charlottetown",
+    "st\\.? john'?s", "whitehorse", "yellowknife", "iqaluit", "dawson city",
+    # landmarks
+    "cn tower", "stanley park", "capilano", "grouse mountain", "granville island", "lake louise", "moraine lake",
+    "rockies", "rocky mountains", "icefields parkway", "parliament hill", "rideau", "old quebec", "chateau frontenac",
+    "cabot trail", "peggy'?s cove", "bay of fundy", "hopewell rocks", "gros morne", "algonquin", "thousand islands",
+    "butchart gardens", "sea to sky", "okanagan", "northern lights",
+]
+_IN_SCOPE_GUARD = re.compile(r"\b(?:" + "|".join(_IN_SCOPE_TERMS) + r")\b", re.IGNORECASE)
+
+def looks_in_scope(text):
+    """True when the message mentions taxes, bookings or a Canadian place (never refused locally)."""
+    return bool(_IN_SCOPE_GUARD.search(text or ""))
+
+
+# ─── 3) OFF-TOPIC CLASSIFIER ────────────────────────────────────────────────────
+_IN_SCOPE = [
+    "what is my tax due", "how much refund will i get", "show my tax record", "what are my deductions",
+    "what is my taxable income", "did i pay enough tax this year", "do i owe the cra money",
+    "when is the tax filing deadline in canada", "what is the gst rate in bc", "how do rrsp deductions work",
+    "find an accounting firm in vancouver", "tax consulting offices near toronto", "canada capital gains tax rules",
+    "how is the carbon tax rebate paid", "what tax credits can students claim in canada",
+    "things to do in whistler", "best attractions in banff", "places to visit in quebec city",
+    "tourist spots in vancouver", "what should i see in niagara falls", "hiking trails in jasper national park",
+    "book a meeting with gian", "schedule a consultation next monday at 10", "book meeting 19 may 2025 at 12 pm",
+    "list my bookings", "what are my upcoming meetings", "cancel my booking on friday",
+    "reschedule my appointment to tuesday 2 pm", "move my meeting to next week",
+    "hello", "hi there", "thanks", "thank you so much", "my name is jim halpert", "who are you",
+    "what can you help me with", "can you explain my refund balance", "tax brackets in british columbia",
+    "is my balance negative", "how do i pay my tax balance", "ontario provincial tax rate",
+    "how does the first home savings account work", "tfsa contribution room", "how much can i put in my rrsp",
+    "how do i report rental income", "can i deduct my home office", "what is the basic personal amount",
+    "do i need to pay tax on my side hustle", "how are dividends taxed", "when do i get my gst credit",
+    "what is a notice of assessment", "how do i set up cra my account", "what happens if i file late",
+    "tell me about the cn tower", "tell me about stanley park", "what is lake louise like in winter",
+    "where can i see the northern lights", "best restaurants in montreal", "museums in ottawa",
+    "what to do in calgary during stampede", "is the capilano suspension bridge worth it",
+    "festivals in toronto this summer", "best time to visit the rockies", "ski resorts near vancouver",
+    "can i talk to a real person", "i need help", "what time is it in vancouver", "ok", "sounds good",
+    "can you check again", "what did i just ask you", "please explain that again", "yes please", "no thanks",
+    "i have a question", "i have another question", "can you summarize that", "give me a short summary",
+    "give me more details", "what does that mean", "what is the difference between them", "can you repeat that",
+    "i don't understand", "how does this work", "what is the best option for me", "how can i contact you",
+    "what is the best way to reach gian", "can you say that in simpler words", "tell me more about that",
+    "is that correct", "are you sure", "what should i do next", "that helps a lot", "great answer",
+]
+_OFF_TOPIC = [
+    "write me a python script to sort a list", "fix this javascript bug", "explain how neural networks work",
+    "give me a recipe for chocolate cake", "how do i cook pasta carbonara", "what should i eat for dinner",
+    "who won the world cup", "what is the score of the lakers game", "tell me about the premier league",
+    "write a poem about the ocean", "write a love letter for my girlfriend", "tell me a bedtime story about dragons",
+    "what is the capital of france", "how far is the moon from earth", "explain quantum physics",
+    "solve this equation 3x plus 5 equals 20", "what is the derivative of x squared", "help me with my calculus homework",
+    "recommend a good movie on netflix", "what songs are popular right now", "who is the best actor in hollywood",
+    "what is the weather in tokyo", "plan my trip to paris", "best beaches in thailand", "hotels in new york city",
+    "how do i lose weight fast", "what medicine should i take for a headache", "symptoms of the flu",
+    "which stock should i buy today", "predict the bitcoin price", "how do i fix my car engine",
+    "translate this sentence into spanish", "how do i train my dog", "what is the meaning of life",
+    "who is the president of the united states", "write an essay about world war two",
+    "play a game of chess with me", "generate a picture of a cat", "how to install windows 11",
+    "what is the best video game of all time", "how do i knit a scarf", "tell me a joke about programmers",
+    "write a short story about a robot", "compose a song about summer", "make up a limerick",
+    "how do i bake cookies", "give me a smoothie recipe", "how long do i boil an egg",
+    "who won the nba finals", "when is the next olympics", "who is the best soccer player",
+    "explain how the internet works", "how does machine learning work", "what is an api",
+    "what is the capital of japan", "what is the population of china", "how tall is mount everest",
+    "debug my python code", "write sql for my database", "how do i center a div in css",
+    "suggest a tv series to binge", "who sang this song", "best albums of the year",
+    "best hotels in london", "cheap flights to mexico", "things to do in tokyo",
+]
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+def _features(text):
+    words = _TOKEN.findall((text or "").lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class OffTopicClassifier:
+    """
+    TF-IDF (unigrams + bigrams) followed by L2-regularized logistic regression, all in NumPy.
+    Both classes get the same total weight, so adding examples to one list doesn't skew the scores.
+    """
+
+    def __init__(self, in_scope, off_topic, epochs=3000, lr=5.0, l2=1e-4):
+        docs = [_features(t) for t in in_scope + off_topic]
+        y = np.array([0.0] * len(in_scope) + [1.0] * len(off_topic))
+        weight = np.where(y == 1, len(docs) / (2 * len(off_topic)), len(docs) / (2 * len(in_scope)))
+        df = Counter(term for d in docs for term in set(d))
+        self.vocab = {term: i for i, term in enumerate(sorted(df))}
+        n = len(docs)
+        self.idf = np.array([math.log((1 + n) / (1 + df[t])) + 1 for t in sorted(df)])
+        X = np.vstack([self._vector(d) for d in docs])
+
+        self.w = np.zeros(X.shape[1])
+        self.b = 0.0
+        for _ in range(epochs):
+            p = 1 / (1 + np.exp(-(X @ self.w + self.b)))
+            grad = (p - y) * weight
+            self.w -= lr * (X.T @ grad / n + l2 * self.w)
+            self.b -= lr * grad.mean()
+
+    def _vector(self, terms):
+        v = np.zeros(len(self.vocab))
+        for term, count in Counter(terms).items():
+            i = self.vocab.get(term)
+            if i is not None:
+                v[i] = count * self.idf[i]
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def off_topic_probability(self, text):
+        v = self._vector(_features(text))
+        if not v.any():         # nothing we recognise -> let the agent decide
+            return 0.0
+        return float(1 / (1 + np.exp(-(v @ self.w + self.b))))
+
+
+# ─── 4) ROUTER ──────────────────────────────────────────────────────────────────
+class RouteDecision:
+    def __init__(self, route, reply):
+        self.route = route      # "verify" or "refuse"
+        self.reply = reply
+
+
+class Router:
+    """
+    route(text) returns a RouteDecision when the message can be answered locally, or None for the agent.
+    is_verified / verify are injected so this module doesn't depend on Streamlit or the tools.
+    """
+
+    def __init__(self, is_verified, verify, classifier=None, threshold=OFF_TOPIC_THRESHOLD):
+        self.is_verified = is_verified
+        self.verify = verify
+        self.classifier = classifier or OffTopicClassifier(_IN_SCOPE, _OFF_TOPIC)
+        self.threshold = threshold
+        self.stats = Counter()
+
+    def route(self, text):
+        # Credentials only matter before verification; afterwards a "name + number" message goes to the agent
+        if not self.is_verified():
+            creds = extract_credentials(text)
+            if creds:
+                return self._decide("verify", self.verify(*creds), text)
+
+        if looks_in_scope(text):
+            self.stats["agent"] += 1
+            logger.info("router: agent (in-scope terms)")
+            return None
+
+        p = self.classifier.off_topic_probability(text)
+        if p >= self.threshold:
+            return self._decide("refuse", REFUSAL_REPLY, text, f"p_off_topic={p:.2f}")
+
+        self.stats["agent"] += 1
+        logger.info("router: agent (p_off_topic=%.2f)", p)
+        return None
+
+    def _decide(self, route, reply, text, detail=""):
+        self.stats[route] += 1
+        saved = self.stats["verify"] + self.stats["refuse"]
+        logger.info("router: %s %s| LLM calls saved so far: %d | %r", route, detail + " " if detail else "", saved, text[:80])
+        return RouteDecision(route, reply)
+
+
+# ─── 5) HELD-OUT CHECK ──────────────────────────────────────────────────────────
+# None of these are in the training lists above. Run `python router.py` after changing the examples,
+# the guard terms or the threshold; it exits non-zero if an in-scope question is refused or a credential
+# check is wrong, or if fewer than MIN_HELD_OUT_REFUSAL of the off-topic ones are refused locally
+# (the agent would still refuse those, but every one of them is an LLM call the router should have saved).
+HELD_OUT_IN_SCOPE = [
+    "tell me about the cn tower", "explain the first home savings account",
+    "how do I file taxes for a rental property in ontario", "what is the rrsp deadline this year",
+    "how much gst do I pay on a used car", "is my tfsa withdrawal taxable", "fun things for kids in halifax",
+    "where should I stay in tofino", "how do I get to lake louise from calgary", "what is my balance",
+    "can I claim my kids daycare", "what is a t4 slip", "I moved provinces last year what do I file",
+    "best poutine in quebec city", "how cold is winnipeg in january", "cancel everything I booked",
+    "can we meet on thursday afternoon", "what's open on canada day", "do students pay tax on scholarships",
+    "hi gaia", "thanks for your help", "what else can you do", "i have one more question", "give me the summary",
+    "what is the best way to reach you", "can you give me an example", "show me that again",
+    "could you be more specific", "what do you mean by that", "i need some advice", "who are you again",
+]
+HELD_OUT_OFF_TOPIC = [
+    "write a haiku about autumn leaves", "how do i make sourdough bread", "who won the super bowl",
+    "explain how a blockchain works", "what is the capital of germany", "help me debug my react app",
+    "recommend a horror movie", "best hotels in rome",
+]
+HELD_OUT_CREDENTIALS = {
+    "Dwight Schrute 112345": ("Dwight Schrute", "112345"),
+    "Hi, my name is Jim Halpert and my id is 104567": ("Jim Halpert", "104567"),
+    "I'm Pam Beesly, customer ID: 109876": ("Pam Beesly", "109876"),
+    "Angela Martin 3fa85f64": ("Angela Martin", "3fa85f64"),
+    "Things to do in Whistler 2025": None,
+    "book meeting friday 1230": None,
+    "book meeting friday 123456": None,
+    "tax deadline april 2025": None,
+    "my name is Jim Halpert": None,
+    "Oscar Martinez abcdefgh": None,
+}
+
+def check_examples(threshold=OFF_TOPIC_THRESHOLD):
+    """Returns (failures, refused off-topic count); failures is a list of (kind, text, got)."""
+    router = Router(is_verified=lambda: False, verify=lambda name, cid: "verified", threshold=threshold)
+    failures = []
+    for text in HELD_OUT_IN_SCOPE:
+        decision = router.route(text)
+        if decision is not None:
+            failures.append(("in-scope refused", text, router.classifier.off_topic_probability(text)))
+    refused = sum(1 for text in HELD_OUT_OFF_TOPIC if router.route(text) is not None)
+    for text, expected in HELD_OUT_CREDENTIALS.items():
+        got = extract_credentials(text)
+        if got != expected:
+            failures.append(("credentials", text, got))
+    return failures, refused
+
+
+if __name__ == "__main__":
+    import sys
+
+    failures, refused = check_examples()
+    for kind, text, got in failures:
+        print(f"✗ {kind}: {text!r} -> {got}")
+    total = len(HELD_OUT_IN_SCOPE) + len(HELD_OUT_CREDENTIALS)
+    print(f"{total - len(failures)}/{total} in-scope and credential examples routed as expected")
+    rate = refused / len(HELD_OUT_OFF_TOPIC)
+    print(f"{refused}/{len(HELD_OUT_OFF_TOPIC)} off-topic examples answered locally ({rate:.0%}, minimum {MIN_HELD_OUT_REFUSAL:.0%})")
+    sys.exit(1 if failures or rate < MIN_HELD_OUT_REFUSAL else 0)
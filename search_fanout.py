@@ -0,0 +1,192 @@
+# Multi-query fan-out for the search tool.
+#
+# A compound question ("tax deadlines and things to do in Whistler") used to go to Tavily as one query, the top 3
+# results covered only half of it, and the agent spent another step searching again. Now:
+#   1) split_query()  breaks the request into sub-queries (on ; ? newlines, and on " and " only between two clauses
+#                     that each have a question word or verb, or two phrases about different topics - tax vs travel.
+#                     "capital gains and dividend taxation" stays one query)
+#   2) fan_out()      runs them at the same time on a small bounded pool (each still goes through outbound.py)
+#   3) merge()        interleaves the result lists and drops duplicates: same URL after normalizing, or near-identical
+#                     content (character-trigram Jaccard similarity)
+# search_tool then does one summarization pass over the merged list, so a broad question costs one tool step
+# and about one search's worth of wall-clock time.
+#
+# Settings in .env: SEARCH_WORKERS=4, SEARCH_MAX_SUBQUERIES=4
+
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger("gaia.search")
+
+WORKERS = int(os.environ.get("SEARCH_WORKERS", 4))
+MAX_SUBQUERIES = int(os.environ.get("SEARCH_MAX_SUBQUERIES", 4))
+MAX_RESULTS = 8                 # merged results handed to the summarizer
+SIMILARITY = 0.6                # trigram Jaccard at or above this = same content
+
+_HARD_SPLIT = re.compile(r"[;?\n]+")
+_AND_SPLIT = re.compile(r"\s+(?:and also|and|&)\s+", re.IGNORECASE)
+_LEADING_AND = re.compile(r"^\s*(?:and also|and|also|&)\s+", re.IGNORECASE)
+# A side of " and " counts as its own question if it has one of these (or see _TOPICS below). Nouns joined
+# by "and" ("best hikes near Banff and Jasper") share their context, and splitting them would lose it.
+_CLAUSE_WORDS = {
+    "what", "what's", "whats", "when", "where", "who", "why", "how", "which", "whether",
+    "is", "are", "was", "were", "do", "does", "did", "can", "could", "should", "would", "will", "has", "have",
+    "find", "show", "tell", "explain", "compare", "list", "recommend", "suggest", "give", "get", "book",
+    "visit", "see", "go", "stay", "eat", "file", "pay", "claim", "apply", "register", "open", "contribute",
+    "owe", "work", "works", "change", "changed", "cost", "costs", "need", "want",
+}
+# The two things GAIA searches for. Two noun phrases about different ones ("tax deadlines and things to do in
+# Whistler") are separate questions; two about the same one ("capital gains and dividend taxation") are not.
+_TOPICS = {
+    "tax": re.compile(
+        r"\b(tax\w*|rrsp|tfsa|fhsa|resp|gst|hst|pst|cra|deadlines?|refunds?|deductions?|credits?|"
+        r"income|capital gains|dividends?|benefits?|pension|contribution|limits?)\b", re.IGNORECASE),
+    "travel": re.compile(
+        r"\b(things to (?:do|see)|places to \w+|hotels?|motels?|resorts?|restaurants?|food|attractions?|"
+        r"hikes?|hiking|trails?|parks?|museums?|beach(?:es)?|ski(?:ing)?|tours?|festivals?|camping|"
+        r"sightseeing|events?|nightlife|shopping|weather)\b", re.IGNORECASE),
+}
+_TRACKING = re.compile(r"^(utm_\w+|gclid|fbclid|mc_cid|mc_eid|ref)$", re.IGNORECASE)
+
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="gaia-search")
+
+
+# ─── 1) QUERY SPLITTING ─────────────────────────────────────────────────────────
+def _is_clause(text):
+    return any(w in _CLAUSE_WORDS for w in re.findall(r"[a-z']+", text.lower()))
+
+def _topics(text):
+    return {name for name, pattern in _TOPICS.items() if pattern.search(text)}
+
+def _separate_questions(clauses):
+    """True when the sides of " and " should be searched separately."""
+    if all(_is_clause(c) for c in clauses):
+        return True
+    # noun phrases: split only when each side is about exactly one topic and neighbours differ
+    topics = [_topics(c) for c in clauses]
+    return all(len(t) == 1 for t in topics) and all(a != b for a, b in zip(topics, topics[1:]))
+
+def split_query(query, max_parts=MAX_SUBQUERIES):
+    """Sub-queries of a compound request (a single-topic query comes back as [query])."""
+    parts = []
+    for piece in _HARD_SPLIT.split(query):
+        piece = _LEADING_AND.sub("", piece)
+        clauses = _AND_SPLIT.split(piece)
+        # only split on "and" when every side is a question of its own, not a list of nouns
+        if len(clauses) > 1 and _separate_questions(clauses):
+            parts.extend(clauses)
+        else:
+            parts.append(piece)
+
+    seen, unique = set(), []
+    for part in parts:
+        part = part.strip(" ,.")
+        if len(part) >= 3 and part.lower() not in seen:
+            seen.add(part.lower())
+            unique.append(part)
+    if len(unique) <= 1:
+        return [query.strip()]
+    return unique[:max_parts]
+
+# Expected splits, checked by `python search_fanout.py` (exits non-zero on a mismatch)
+EXAMPLES = {
+    "capital gains and dividend taxation in Canada": ["capital gains and dividend taxation in Canada"],
+    "best hikes near Banff and Jasper national parks": ["best hikes near Banff and Jasper national parks"],
+    "RRSP and TFSA contribution limits for 2025": ["RRSP and TFSA contribution limits for 2025"],
+    "tax credits for seniors and students": ["tax credits for seniors and students"],
+    "when is the tax filing deadline and what can I do in Whistler":
+        ["when is the tax filing deadline", "what can I do in Whistler"],
+    "how do I register for GST and what is the HST rate in Ontario":
+        ["how do I register for GST", "what is the HST rate in Ontario"],
+    "What is the GST rate in BC? And where should I stay in Tofino?":
+        ["What is the GST rate in BC", "where should I stay in Tofino"],
+    "CRA deadlines; things to do in Banff": ["CRA deadlines", "things to do in Banff"],
+    "things to do in Toronto": ["things to do in Toronto"],
+    "tax deadlines and things to do in Whistler": ["tax deadlines", "things to do in Whistler"],
+    "RRSP limits and hotels in Banff": ["RRSP limits", "hotels in Banff"],
+    "GST rate in BC and best restaurants in Vancouver": ["GST rate in BC", "best restaurants in Vancouver"],
+    "hotels and restaurants in Jasper": ["hotels and restaurants in Jasper"],
+    "income tax and GST registration for freelancers": ["income tax and GST registration for freelancers"],
+}
+
+
+# ─── 2) DEDUPLICATION ───────────────────────────────────────────────────────────
+def normalize_url(url):
+    """Lowercase host without www., no fragment, no tracking parameters, no trailing slash."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query) if not _TRACKING.match(k)))
+    return urlunsplit(("", host, parts.path.rstrip("/"), query, ""))
+
+def trigrams(text):
+    text = " ".join(re.findall(r"\w+", text.lower()))
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def merge(result_lists, limit=MAX_RESULTS, threshold=SIMILARITY):
+    """
+    Round-robin over the sub-query result lists (so every sub-query gets its top hits in), skipping
+    results whose URL or content was already taken. Returns at most limit results.
+    """
+    merged, urls, grams = [], set(), []
+    dropped = 0
+    for rank in range(max((len(r) for r in result_lists), default=0)):
+        for results in result_lists:
+            if rank >= len(results) or len(merged) >= limit:
+                continue
+            item = results[rank]
+            url = normalize_url(item.get("url", "")) if item.get("url") else None
+            g = trigrams(item.get("content", ""))
+            if (url and url in urls) or any(jaccard(g, other) >= threshold for other in grams):
+                dropped += 1
+                continue
+            merged.append(item)
+            if url:
+                urls.add(url)
+            grams.append(g)
+    if dropped:
+        logger.info("search: dropped %d duplicate result(s)", dropped)
+    return merged
+
+
+# ─── 3) FAN-OUT ─────────────────────────────────────────────────────────────────
+def fan_out(queries, search):
+    """
+    Runs search(query) for every sub-query concurrently (bounded by SEARCH_WORKERS) and returns the
+    results in query order. A failing sub-query is logged and left out; if all of them fail the first error is raised.
+    """
+    if len(queries) == 1:
+        return [search(queries[0])]
+    futures = [_pool.submit(search, q) for q in queries]
+    results, errors = [], []
+    for q, fut in zip(queries, futures):
+        try:
+            results.append(fut.result())
+        except Exception as e:
+            logger.warning("search: sub-query %r failed (%s)", q, e)
+            errors.append(e)
+    if not results:
+        raise errors[0]
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    wrong = [(q, split_query(q), want) for q, want in EXAMPLES.items() if split_query(q) != want]
+    for q, got, want in wrong:
+        print(f"✗ {q!r}\n    got  {got}\n    want {want}")
+    print(f"{len(EXAMPLES) - len(wrong)}/{len(EXAMPLES)} split examples as expected")
+    sys.exit(1 if wrong else 0)
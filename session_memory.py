@@ -0,0 +1,280 @@
+# Per-session memory accounting and idle-session clean-up for the Streamlit app.
+#
+# Every browser session keeps its own MemorySaver (the whole conversation), a compiled agent, the chat transcript
+# lists and an OpenAI client in st.session_state. Streamlit only frees them when the session disconnects,
+# so a long-running deployment slowly fills up with tabs nobody is looking at.
+#
+#   touch()   - called at the top of every run: registers the session and marks it as active
+#   sweep()   - (throttled, runs from touch) applies the policy to sessions idle for longer than SESSION_IDLE_TTL_S:
+#                 offload -> conversation is pickled to SESSION_OFFLOAD_DIR and restored on the session's next run
+#                 evict   -> conversation is dropped, the session starts a fresh chat next time
+#               and, if SESSION_MEMORY_BUDGET_MB is set, offloads the least recently seen sessions until under budget
+#   report()  - per-session sizes for the admin page
+#   A session is forgotten (and its offload file deleted) only once Streamlit's session manager no longer has it.
+#
+# Settings in .env: SESSION_IDLE_TTL_S=1800, SESSION_POLICY=offload|evict, SESSION_MEMORY_BUDGET_MB=0 (0 = no budget)
+
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger("gaia.sessions")
+
+IDLE_TTL_S = float(os.environ.get("SESSION_IDLE_TTL_S", 1800))
+POLICY = os.environ.get("SESSION_POLICY", "offload").lower()
+BUDGET_BYTES = int(float(os.environ.get("SESSION_MEMORY_BUDGET_MB", 0)) * 1024 * 1024)
+OFFLOAD_DIR = os.environ.get("SESSION_OFFLOAD_DIR", ".cache/sessions")
+SWEEP_EVERY_S = 60
+
+# session_state keys that hold per-session conversation data (all rebuilt lazily by app.py)
+HEAVY_KEYS = ("memory", "agent", "chat", "openai_client", "past", "generated", "voice_history",
+              "_transcript_md_cache")     # transcript_view.CACHE_KEY
+TRANSCRIPT_KEYS = ("past", "generated", "voice_history")
+_OFFLOADED = "_session_offloaded"
+
+_lock = threading.Lock()
+_sessions = {}          # session id -> {"state": the session's SessionState, "last_seen": time}
+_last_sweep = 0.0
+
+
+# ─── 1) SIZE ACCOUNTING ─────────────────────────────────────────────────────────
+_SKIP = (type, type(sys), type(len), type(lambda: 0), threading.Lock().__class__)
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes reachable from obj (containers, bytes, objects' __dict__). Each object is counted once."""
+    seen = set() if seen is None else seen
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _SKIP):
+            continue
+        seen.add(id(o))
+        try:
+            total += sys.getsizeof(o)
+        except TypeError:
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif hasattr(o, "__dict__"):
+            stack.append(vars(o))
+    return total
+
+def checkpointer_bytes(saver):
+    """Size of what a MemorySaver holds (checkpoints, pending writes, channel blobs), not the saver object itself."""
+    seen = set()
+    return sum(deep_sizeof(getattr(saver, name), seen) for name in ("storage", "writes", "blobs") if hasattr(saver, name))
+
+def session_bytes(state):
+    """Per-session memory: the checkpointer contents plus the transcript lists. The model/tools are shared, not counted."""
+    sizes = {"checkpointer": 0, "transcript": 0}
+    if _has(state, "memory"):
+        sizes["checkpointer"] = checkpointer_bytes(state["memory"])
+    seen = set()
+    for key in TRANSCRIPT_KEYS + ("_transcript_md_cache",):
+        if _has(state, key):
+            sizes["transcript"] += deep_sizeof(state[key], seen)
+    sizes["total"] = sizes["checkpointer"] + sizes["transcript"]
+    return sizes
+
+def _has(state, key):
+    try:
+        return key in state
+    except Exception:
+        return False
+
+
+# ─── 2) REGISTRY ────────────────────────────────────────────────────────────────
+# Sessions are tracked by session id with a normal (strong) reference to their SessionState.
+# ctx.session_state can't be used for that: it is a thin wrapper that Streamlit creates for every script run,
+# so a weak ref to it dies as soon as the run ends. Whether a session still exists is asked from Streamlit's
+# session manager instead; only when it says a session is gone do we forget it and delete its offload file.
+def _session_manager():
+    try:
+        from streamlit.runtime import Runtime
+        return Runtime.instance()._session_mgr
+    except Exception:           # not running under `streamlit run`, or the internals moved
+        return None
+
+def _runtime_states():
+    """{session id: SessionState} for every session Streamlit still holds (connected or not), or None if unknown."""
+    mgr = _session_manager()
+    if mgr is None:
+        return None
+    try:
+        return {info.session.id: info.session.session_state for info in mgr.list_sessions()}
+    except Exception:
+        return None
+
+def _current():
+    """(session id, the session's state object) for the running script, or (None, None) outside Streamlit."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None, None
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None, None
+    # the session's own SessionState (lives as long as the session), not the per-run wrapper
+    state = getattr(ctx.session_state, "_state", ctx.session_state)
+    mgr = _session_manager()
+    try:
+        state = mgr.get_session_info(ctx.session_id).session.session_state
+    except Exception:
+        pass
+    return ctx.session_id, state
+
+def touch():
+    """Marks the current session as active (call once per run). Restores it if it was offloaded. Runs a sweep now and then."""
+    sid, state = _current()
+    if sid is None:
+        return
+    with _lock:
+        _sessions[sid] = {"state": state, "last_seen": time.time()}
+    if _has(state, _OFFLOADED):
+        restore(sid, state)
+    sweep()
+
+def forget(sid):
+    """Drops a closed session: its registry entry and any offloaded conversation it can no longer come back for."""
+    with _lock:
+        _sessions.pop(sid, None)
+    _remove_file(sid)
+
+def _live_sessions_list():
+    """[(session id, registry entry, state)] for sessions that still exist; forgets the ones Streamlit has closed."""
+    states = _runtime_states()
+    live, gone = [], []
+    with _lock:
+        for sid, entry in list(_sessions.items()):
+            if states is not None and sid not in states:
+                gone.append(sid)            # Streamlit closed the session for good
+            else:
+                live.append((sid, entry, entry["state"]))
+    for sid in gone:
+        forget(sid)
+    return live
+
+
+# ─── 3) OFFLOAD / RESTORE / EVICT ───────────────────────────────────────────────
+def _path(sid):
+    return os.path.join(OFFLOAD_DIR, f"{sid}.pkl")
+
+def _remove_file(sid):
+    try:
+        os.remove(_path(sid))
+    except FileNotFoundError:
+        pass
+
+def _drop(state):
+    for key in HEAVY_KEYS:
+        if _has(state, key):
+            del state[key]
+
+def offload(sid, state):
+    """Writes the session's conversation to disk and frees it from memory. Returns bytes freed (estimate)."""
+    freed = session_bytes(state)["total"]
+    chat = state["chat"] if _has(state, "chat") else None
+    data = {
+        "messages": chat.messages() if chat is not None else [],
+        **{key: state[key] for key in TRANSCRIPT_KEYS if _has(state, key)},
+    }
+    os.makedirs(OFFLOAD_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=OFFLOAD_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, _path(sid))
+    _drop(state)
+    state[_OFFLOADED] = True
+    logger.info("sessions: offloaded %s (%d KB)", sid[:8], freed // 1024)
+    return freed
+
+def evict(sid, state):
+    """Drops the session's conversation without saving it. Returns bytes freed (estimate)."""
+    freed = session_bytes(state)["total"]
+    _drop(state)
+    _remove_file(sid)
+    logger.info("sessions: evicted %s (%d KB)", sid[:8], freed // 1024)
+    return freed
+
+def restore(sid, state):
+    """Loads an offloaded conversation back: transcript lists now, checkpointer messages via pending_messages()."""
+    if _has(state, _OFFLOADED):
+        del state[_OFFLOADED]
+    try:
+        with open(_path(sid), "rb") as f:
+            data = pickle.load(f)
+    except FileNotFoundError:
+        return
+    _remove_file(sid)
+    for key in TRANSCRIPT_KEYS:
+        if key in data:
+            state[key] = data[key]
+    state["_restored_messages"] = data.get("messages", [])
+    logger.info("sessions: restored %s", sid[:8])
+
+def pending_messages():
+    """Messages of a restored conversation, to load into the new ChatSession (once). Empty list otherwise."""
+    from streamlit import session_state
+    return session_state.pop("_restored_messages", [])
+
+
+# ─── 4) POLICY ──────────────────────────────────────────────────────────────────
+def sweep(force=False, idle_ttl=None):
+    """Applies the idle policy and the memory budget to every other session. Returns the number of sessions cleaned up."""
+    global _last_sweep
+    now = time.time()
+    if not force and now - _last_sweep < SWEEP_EVERY_S:
+        return 0
+    _last_sweep = now
+    idle_ttl = IDLE_TTL_S if idle_ttl is None else idle_ttl
+    current, _ = _current()
+
+    cleaned = 0
+    candidates = []
+    for sid, entry, state in _live_sessions_list():
+        if sid == current or not _has(state, "memory"):
+            continue
+        if now - entry["last_seen"] >= idle_ttl:
+            (evict if POLICY == "evict" else offload)(sid, state)
+            cleaned += 1
+        elif now - entry["last_seen"] >= SWEEP_EVERY_S:      # never touch a session that may be mid-run
+
+            candidates.append((entry["last_seen"], sid, state))
+
+    if BUDGET_BYTES:
+        # the budget counts every live session, but only idle-ish ones can be offloaded to meet it
+        total = sum(session_bytes(state)["total"] for _, _, state in _live_sessions_list() if _has(state, "memory"))
+        for _, sid, state in sorted(candidates, key=lambda c: c[0]):     # least recently seen first
+            if total <= BUDGET_BYTES:
+                break
+            total -= offload(sid, state)
+            cleaned += 1
+    return cleaned
+
+def report():
+    """One row per known session for the admin page."""
+    now = time.time()
+    current, _ = _current()
+    rows = []
+    for sid, entry, state in _live_sessions_list():
+        sizes = session_bytes(state)
+        rows.append({
+            "Session": sid[:8] + (" (you)" if sid == current else ""),
+            "Idle (min)": round((now - entry["last_seen"]) / 60, 1),
+            "Checkpointer (KB)": round(sizes["checkpointer"] / 1024, 1),
+            "Transcript (KB)": round(sizes["transcript"] / 1024, 1),
+            "Total (KB)": round(sizes["total"] / 1024, 1),
+            "Status": "offloaded" if _has(state, _OFFLOADED) else ("active" if _has(state, "memory") else "empty"),
+        })
+    return sorted(rows, key=lambda r: -r["Total (KB)"])
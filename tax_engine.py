@@ -0,0 +1,259 @@
+# Tax computation in one place, so the Add Record form, the Manage Records page and bulk jobs
+# all derive Taxable Income / Tax Due / Refund/Balance the same way.
+#
+# A rule set is a plain dict with progressive brackets for federal and provincial tax.
+# Each bracket is (lower threshold, marginal rate); the last one has no upper limit.
+# Everything is vectorized with NumPy so a whole column (or millions of rows) is computed at once.
+
+import argparse
+import os
+import time
+
+import numpy as np
+from pymongo import UpdateOne
+
+import records_snapshot
+from record_schema import INPUT_FIELDS, DERIVED_FIELDS
+
+# ─── 1) RULE SETS ───────────────────────────────────────────────────────────────
+# FLAT_15 is the original app behaviour (15% of taxable income, no provincial tax).
+FLAT_15 = {
+    "name": "flat15",
+    "federal":    [(0, 0.15)],
+    "provincial": [],
+}
+
+# 2024 federal + British Columbia brackets (marginal rates only; personal credits are not modelled).
+BC_2024 = {
+    "name": "bc2024",
+    "federal": [
+        (0,       0.15),
+        (55_867,  0.205),
+        (111_733, 0.26),
+        (173_205, 0.29),
+        (246_752, 0.33),
+    ],
+    "provincial": [
+        (0,       0.0506),
+        (47_937,  0.077),
+        (95_875,  0.105),
+        (110_076, 0.1229),
+        (133_664, 0.147),
+        (181_232, 0.168),
+        (252_752, 0.205),
+    ],
+}
+
+RULE_SETS = {r["name"]: r for r in (FLAT_15, BC_2024)}
+
+def get_rules(name_or_rules=None):
+    if name_or_rules is None:
+        return DEFAULT_RULES
+    if isinstance(name_or_rules, dict):
+        return name_or_rules
+    try:
+        return RULE_SETS[name_or_rules]
+    except KeyError:
+        raise ValueError(f"Unknown tax rule set {name_or_rules!r}. Choose from {sorted(RULE_SETS)}")
+
+# Which rule set the app uses; TAX_RULES in .env can switch it (e.g. TAX_RULES=bc2024).
+# A name that doesn't exist fails right here instead of quietly computing with the wrong rules.
+DEFAULT_RULES = get_rules(os.environ.get("TAX_RULES", "flat15"))
+
+
+# ─── 2) VECTORIZED MATH ─────────────────────────────────────────────────────────
+def bracket_tax(taxable, brackets):
+    """
+    Progressive tax for an array of taxable incomes.
+    base[i] is the tax owed at the start of bracket i, so each row is just
+    base[bracket] + (income - threshold) * rate  -> one searchsorted, no Python loop.
+    """
+    taxable = np.maximum(np.asarray(taxable, dtype=np.float64), 0.0)
+    if not brackets:
+        return np.zeros_like(taxable)
+    lows  = np.array([lo for lo, _ in brackets], dtype=np.float64)
+    rates = np.array([rate for _, rate in brackets], dtype=np.float64)
+    base  = np.concatenate(([0.0], np.cumsum(np.diff(lows) * rates[:-1])))
+    idx   = np.searchsorted(lows, taxable, side="right") - 1
+    idx   = np.clip(idx, 0, None)
+    return base[idx] + (taxable - lows[idx]) * rates[idx]
+
+
+def compute_derived(total_income, deductions, tax_paid, rules=None):
+    """Returns a dict of NumPy arrays for the three derived fields."""
+    rules = get_rules(rules)
+    total_income = np.asarray(total_income, dtype=np.float64)
+    deductions   = np.asarray(deductions, dtype=np.float64)
+    tax_paid     = np.asarray(tax_paid, dtype=np.float64)
+
+    taxable = total_income - deductions
+    tax_due = bracket_tax(taxable, rules["federal"]) + bracket_tax(taxable, rules["provincial"])
+    tax_due = np.round(tax_due, 2)
+    return {
+        "Taxable Income": taxable,
+        "Tax Due":        tax_due,
+        "Refund/Balance": np.round(tax_paid - tax_due, 2),
+    }
+
+
+def derive_fields(df, rules=None):
+    """Copy of a records DataFrame with the derived columns recomputed (whole-number columns stay ints, like the csv)."""
+    out = df.copy()
+    cols = {f: out[f].fillna(0).to_numpy() if f in out else np.zeros(len(out)) for f in INPUT_FIELDS}
+    for field, values in compute_derived(cols["Total Income"], cols["Deductions"], cols["Tax Paid"], rules).items():
+        out[field] = values.astype(np.int64) if np.all(np.mod(values, 1) == 0) else values
+    return out
+
+
+def compute_record(total_income, deductions, tax_paid, rules=None):
+    """Derived fields for a single record as plain Python numbers (for the forms in app.py)."""
+    derived = compute_derived([total_income], [deductions], [tax_paid], rules)
+    return {k: _as_number(v[0]) for k, v in derived.items()}
+
+
+def _as_number(x):
+    x = float(x)
+    return int(x) if x.is_integer() else x
+
+
+# ─── 3) BULK RECOMPUTE ──────────────────────────────────────────────────────────
+def _bracket_expr(field_expr, brackets):
+    # Same formula as bracket_tax, written as a Mongo aggregation expression:
+    # sum over brackets of max(0, min(x, next threshold) - threshold) * rate
+    terms = []
+    for i, (lo, rate) in enumerate(brackets):
+        upper = field_expr if i + 1 == len(brackets) else {"$min": [field_expr, brackets[i + 1][0]]}
+        terms.append({"$multiply": [{"$max": [0, {"$subtract": [upper, lo]}]}, rate]})
+    return {"$add": terms} if terms else 0
+
+
+def recompute_pipeline(rules=None):
+    """Update pipeline that recomputes the derived fields on the server, no documents leave Mongo."""
+    rules = get_rules(rules)
+    income = {"$ifNull": ["$Total Income", 0]}
+    deduct = {"$ifNull": ["$Deductions", 0]}
+    paid   = {"$ifNull": ["$Tax Paid", 0]}
+    taxable = {"$subtract": [income, deduct]}
+    return [
+        {"$set": {"Taxable Income": taxable}},
+        {"$set": {"Tax Due": {"$round": [{"$add": [
+            _bracket_expr("$Taxable Income", rules["federal"]),
+            _bracket_expr("$Taxable Income", rules["provincial"]),
+        ]}, 2]}}},
+        {"$set": {"Refund/Balance": {"$round": [{"$subtract": [paid, "$Tax Due"]}, 2]}}},
+        # Row Hash is left alone: it only covers the inputs (see record_schema.py), which don't change here
+    ]
+
+
+def recompute_all(coll, rules=None, server_side=True, batch_size=5000, query=None):
+    """
+    Recomputes the derived fields of every record (or those matching query).
+    server_side=True runs one update_many with an aggregation pipeline.
+    server_side=False streams the inputs in batches, computes with NumPy and writes
+    unordered bulk updates of just the derived fields. Returns the number of records touched.
+    The local snapshot (if enabled) is rebuilt afterwards, since potentially every record changed.
+    """
+    query = query or {}
+    if server_side:
+        touched = coll.update_many(query, recompute_pipeline(rules)).modified_count
+    else:
+        touched = _recompute_batched(coll, rules, batch_size, query)
+    if records_snapshot.enabled():
+        records_snapshot.rebuild(coll)
+    return touched
+
+
+def _recompute_batched(coll, rules, batch_size, query):
+    touched = 0
+    batch = []
+    cursor = coll.find(query, {f: 1 for f in INPUT_FIELDS}).batch_size(batch_size)
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            touched += _write_batch(coll, batch, rules)
+            batch = []
+    if batch:
+        touched += _write_batch(coll, batch, rules)
+    return touched
+
+
+def _write_batch(coll, docs, rules):
+    cols = {f: np.array([d.get(f) or 0 for d in docs], dtype=np.float64) for f in INPUT_FIELDS}
+    derived = compute_derived(cols["Total Income"], cols["Deductions"], cols["Tax Paid"], rules)
+    ops = []
+    for i, doc in enumerate(docs):
+        new_values = {field: _as_number(derived[field][i]) for field in DERIVED_FIELDS}
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": new_values}))
+    coll.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+# ─── 4) WHAT-IF COMPARISON ──────────────────────────────────────────────────────
+def load_input_columns(coll, batch_size=50_000):
+    """Streams just the input fields out of Mongo into NumPy arrays (no per-record dicts kept)."""
+    chunks = {f: [] for f in INPUT_FIELDS}
+    buf = {f: [] for f in INPUT_FIELDS}
+    projection = {f: 1 for f in INPUT_FIELDS} | {"_id": 0}
+    for doc in coll.find({}, projection).batch_size(batch_size):
+        for f in INPUT_FIELDS:
+            buf[f].append(doc.get(f) or 0)
+        if len(buf[INPUT_FIELDS[0]]) >= batch_size:
+            for f in INPUT_FIELDS:
+                chunks[f].append(np.array(buf[f], dtype=np.float64))
+                buf[f] = []
+    for f in INPUT_FIELDS:
+        chunks[f].append(np.array(buf[f], dtype=np.float64))
+    return {f: np.concatenate(chunks[f]) for f in INPUT_FIELDS}
+
+
+def what_if(total_income, deductions, tax_paid, rules_a, rules_b):
+    """
+    Compares two rule sets over the same records.
+    Returns a summary dict: total tax under each, the difference, and how many people pay more / less.
+    """
+    a = compute_derived(total_income, deductions, tax_paid, rules_a)["Tax Due"]
+    b = compute_derived(total_income, deductions, tax_paid, rules_b)["Tax Due"]
+    delta = b - a
+    return {
+        "records":       int(delta.size),
+        "rules_a":       get_rules(rules_a)["name"],
+        "rules_b":       get_rules(rules_b)["name"],
+        "total_tax_a":   float(a.sum()),
+        "total_tax_b":   float(b.sum()),
+        "total_delta":   float(delta.sum()),
+        "mean_delta":    float(delta.mean()) if delta.size else 0.0,
+        "pay_more":      int((delta > 0.005).sum()),
+        "pay_less":      int((delta < -0.005).sum()),
+    }
+
+
+# ─── 5) CLI ─────────────────────────────────────────────────────────────────────
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute or compare tax rules over the tax records collection.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    rc = sub.add_parser("recompute", help="recompute Taxable Income / Tax Due / Refund/Balance for every record")
+    rc.add_argument("--rules", default=DEFAULT_RULES["name"], choices=sorted(RULE_SETS))
+    rc.add_argument("--batched", action="store_true", help="compute client-side with NumPy instead of a server pipeline")
+    wi = sub.add_parser("what-if", help="compare two rule sets over every record")
+    wi.add_argument("rules_a", choices=sorted(RULE_SETS))
+    wi.add_argument("rules_b", choices=sorted(RULE_SETS))
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    load_dotenv()
+    coll = MongoClient(os.environ["MONGO_URI"])[os.environ["MONGO_DB"]][os.environ["MONGO_COLL"]]
+
+    started = time.monotonic()
+    if args.cmd == "recompute":
+        n = recompute_all(coll, args.rules, server_side=not args.batched)
+        print(f"Recomputed {n:,} records with '{args.rules}' in {time.monotonic() - started:,.1f}s")
+    else:
+        cols = load_input_columns(coll)
+        summary = what_if(cols["Total Income"], cols["Deductions"], cols["Tax Paid"], args.rules_a, args.rules_b)
+        for k, v in summary.items():
+            print(f"{k:>12}: {v:,.2f}" if isinstance(v, float) else f"{k:>12}: {v}")
+        print(f"({time.monotonic() - started:,.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Windowed rendering of chat transcripts (text chat and the voice Q&A history).
+#
+# Streamlit reruns the whole page on every interaction, so drawing every message each time makes long
+# conversations slower and slower. Here only the most recent turns are drawn (WINDOW, as chat bubbles);
+# older turns stay hidden until the user clicks "Show older", and then come in PAGE turns at a time as one
+# markdown block per page. Built blocks are cached in the session's own state (CACHE_KEY), holding only the
+# blocks currently on screen, so paging back through a long conversation doesn't rebuild the same text on every
+# rerun, and the cache goes away with the session (session_memory drops it along with the transcript).
+#
+# Window size can be changed in .env: CHAT_WINDOW=20, CHAT_PAGE=25
+
+import os
+
+import streamlit as st
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WINDOW = int(os.environ.get("CHAT_WINDOW", 20))
+PAGE = int(os.environ.get("CHAT_PAGE", 25))
+CACHE_KEY = "_transcript_md_cache"      # listed in session_memory.HEAVY_KEYS
+
+
+class PairedTurns:
+    """Two parallel lists (e.g. past / generated) viewed as (question, answer) turns, without zipping all of them."""
+
+    def __init__(self, questions, answers):
+        self.questions = questions
+        self.answers = answers
+
+    def __len__(self):
+        return min(len(self.questions), len(self.answers))
+
+    def __getitem__(self, s):
+        return list(zip(self.questions[s], self.answers[s]))
+
+
+# ─── 1) CACHED MARKDOWN ─────────────────────────────────────────────────────────
+def message_markdown(label, text):
+    """One message as markdown, e.g. '**Q3:** ...'."""
+    return f"**{label}:** {text}"
+
+def _block_markdown(turns, first, style):
+    # turns is a tuple of (question, answer); first is the 1-based number of turns[0]
+    parts = []
+    for n, (q, a) in enumerate(turns, start=first):
+        if style == "qa":
+            parts.append(message_markdown(f"Q{n}", q) + "\n\n" + message_markdown(f"A{n}", a))
+        else:
+            parts.append(message_markdown("You", q) + "\n\n" + message_markdown("GAIA", a))
+    return "\n\n---\n\n".join(parts)
+
+def _cached_blocks(key, blocks, style):
+    """
+    Markdown for each (first, turns) block, reusing what this session built on the previous rerun.
+    The cache only keeps the blocks drawn this time, so it never holds more than the visible older pages.
+    """
+    cache = st.session_state.setdefault(CACHE_KEY, {})
+    previous = cache.get(key, {})
+    current = {}
+    for first, turns in blocks:
+        ck = (first, style, turns)      # the turns themselves are the key: a new chat can't reuse old text
+        current[ck] = previous.get(ck) or _block_markdown(turns, first, style)
+    cache[key] = current
+    return [current[(first, style, turns)] for first, turns in blocks]
+
+
+# ─── 2) RENDERING ───────────────────────────────────────────────────────────────
+def _older_controls(key, hidden, pages):
+    if not hidden and not pages:
+        return
+    cols = st.columns(2)
+    if hidden and cols[0].button(f"⬆️ Show older ({hidden} hidden)", key=f"{key}_older"):
+        st.session_state[f"_{key}_pages"] = pages + 1
+        st.rerun()
+    if pages and cols[1].button("⬇️ Hide older", key=f"{key}_hide"):
+        st.session_state[f"_{key}_pages"] = 0
+        st.rerun()
+
+def render_transcript(turns, key, style="chat", window=WINDOW, newest_first=False):
+    """
+    turns: sequence of (question, answer) supporting len() and slicing (a list, or PairedTurns).
+    style: "chat" -> recent turns as st.chat_message bubbles; "qa" -> numbered Q/A markdown (voice history).
+    newest_first: show the latest turn at the top (the voice page does this).
+    Only window + (pages the user opened) * PAGE turns are drawn, whatever the conversation length.
+    """
+    n = len(turns)
+    pages = st.session_state.get(f"_{key}_pages", 0)
+    recent_start = max(0, n - window)
+    # older pages start on multiples of PAGE, so a page's text (and its cached block) doesn't shift as turns are added
+    older_start = max(0, (recent_start - pages * PAGE) // PAGE * PAGE) if pages else recent_start
+
+    blocks = [
+        (b + 1, tuple(turns[b:min(b + PAGE, recent_start)]))
+        for b in range(older_start, recent_start, PAGE)
+    ]
+    recent = list(enumerate(turns[recent_start:n], start=recent_start + 1))
+
+    texts = _cached_blocks(key, blocks, style)
+
+    def _older():
+        for text in (reversed(texts) if newest_first else texts):
+            st.markdown(text)
+
+    def _recent():
+        for i, (q, a) in (reversed(recent) if newest_first else recent):
+            if style == "qa":
+                st.markdown(message_markdown(f"Q{i}", q))
+                st.markdown(message_markdown(f"A{i}", a))
+            else:
+                st.chat_message("user").write(q)
+                st.chat_message("assistant").write(a)
+
+    if newest_first:
+        _recent()
+        _older()
+        _older_controls(key, older_start, pages)
+    else:
+        _older_controls(key, older_start, pages)
+        _older()
+        _recent()
@@ -0,0 +1,69 @@
+# Name matching used by the verify_user tool.
+#
+# Users type names in all sorts of ways ("Jim  Halpert", "jim halpert", "Zoë" vs "Zoe"), and every failed
+# attempt costs another LLM turn. So instead of an exact lower() comparison over every row we:
+#   1) fetch the one record for the Customer ID (indexed find_one or snapshot lookup, see agent_tools.py)
+#   2) normalize both names (accents removed, case-folded, punctuation/whitespace collapsed) and compare
+#   3) if they differ, accept a small edit distance (typos). The ID still has to be exactly right.
+# Nothing is kept in memory between calls, so the cost doesn't grow with the number of customers.
+
+import unicodedata
+
+from record_schema import KEY_FIELD, NAME_FIELD
+
+MAX_EDITS = 2           # never accept more than this many typos
+EDITS_PER_CHARS = 5     # ...and at most one typo per this many characters (short names must be near-exact)
+
+
+def normalize_name(name):
+    """'  Zoë   O'Brien ' -> 'zoe o brien'"""
+    text = unicodedata.normalize("NFKD", str(name or ""))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = "".join(ch if ch.isalnum() else " " for ch in text.casefold())
+    return " ".join(text.split())
+
+
+def bounded_edit_distance(a, b, limit):
+    """
+    Levenshtein distance between a and b, or limit + 1 as soon as it is clear the distance exceeds limit.
+    Only a band of width 2*limit+1 around the diagonal is computed, so cost is O(len * limit).
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+    big = limit + 1
+    prev = [j if j <= limit else big for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        lo, hi = max(1, i - limit), min(len(b), i + limit)
+        cur = [big] * (len(b) + 1)
+        cur[0] = i if i <= limit else big
+        for j in range(lo, hi + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost, big)
+        if min(cur[lo - 1:hi + 1]) > limit:
+            return big
+        prev = cur
+    return prev[len(b)]
+
+
+def name_distance(norm, cand_norm):
+    """Edit distance between two normalized names, or None if it is more than their length allows."""
+    limit = min(MAX_EDITS, max(len(cand_norm), len(norm)) // EDITS_PER_CHARS)
+    dist = bounded_edit_distance(norm, cand_norm, limit)
+    return dist if dist <= limit else None
+
+
+def match_record(name, record):
+    """
+    Matches name against one record already fetched by Customer ID.
+    Returns (full name, customer id as stored, how) where how is "exact" or "fuzzy", or None.
+    """
+    if not record or record.get(NAME_FIELD) is None:
+        return None
+    norm, cand_norm = normalize_name(name), normalize_name(record[NAME_FIELD])
+    if norm == cand_norm:
+        return record[NAME_FIELD], record[KEY_FIELD], "exact"
+    if name_distance(norm, cand_norm) is not None:
+        return record[NAME_FIELD], record[KEY_FIELD], "fuzzy"
+    return None
@@ -0,0 +1,101 @@
+# Sentence-pipelined text-to-speech for voice mode.
+#
+# Before: wait for the whole agent reply -> one TTS call over all of it -> play. The user hears nothing until the end.
+# Now:    agent text is streamed in, cut at sentence boundaries, and every sentence is synthesized on a small
+#         thread pool as soon as it is complete. Audio comes back in sentence order while later sentences
+#         are still being written/synthesized, so playback can start after the first sentence.
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# End of a sentence: . ! ? (optionally followed by quotes/brackets) then whitespace, or a line break
+_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n+")
+MIN_SENTENCE_CHARS = 25       # merge very short pieces ("Hi Jim!") into the next one: fewer, smoother TTS calls
+TTS_WORKERS = 3
+
+
+class SentenceSplitter:
+    """feed(text) returns the sentences completed by that text; flush() returns whatever is left."""
+
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.buffer = ""
+        self.min_chars = min_chars
+
+    def feed(self, text):
+        self.buffer += text
+        sentences = []
+        start = 0
+        for m in _BOUNDARY.finditer(self.buffer):
+            candidate = self.buffer[start:m.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = m.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+
+def pipelined_tts(text_deltas, synthesize, workers=TTS_WORKERS):
+    """
+    text_deltas: iterable of text pieces (e.g. ChatSession.stream()).
+    synthesize:  function(sentence) -> audio bytes (may return None to skip, e.g. nothing speakable).
+    Yields (index, sentence, audio) strictly in sentence order, each as soon as it and all earlier ones are ready.
+    """
+    pending = []        # futures in sentence order; pending[0] is the next one to hand out
+    index = 0
+
+    def _ready():
+        nonlocal index
+        while pending and pending[0][1].done():
+            sentence, fut = pending.pop(0)
+            yield index, sentence, fut.result()
+            index += 1
+
+    splitter = SentenceSplitter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gaia-tts") as pool:
+        for delta in text_deltas:
+            for sentence in splitter.feed(delta):
+                pending.append((sentence, pool.submit(synthesize, sentence)))
+            # checked on every delta, so finished audio goes out while the model is still typing
+            yield from _ready()
+        for sentence in splitter.flush():
+            pending.append((sentence, pool.submit(synthesize, sentence)))
+        # Model is done: hand out the rest in order, waiting for each
+        while pending:
+            sentence, fut = pending.pop(0)
+            yield index, sentence, fut.result()
+            index += 1
+
+
+# Browser side: chains the sentence <audio> elements inside the keyed container so they play one after another.
+# Runs in a components.html iframe and reaches into the parent page (same origin).
+AUDIO_CHAIN_JS = """
+<script>
+(function () {
+  const doc = window.parent.document;
+  const SELECTOR = ".st-key-%(key)s audio";
+  let waiting = true;   // true when nothing is playing and the next clip should start as soon as it appears
+
+  function clips() { return Array.from(doc.querySelectorAll(SELECTOR)); }
+
+  function attach() {
+    clips().forEach(function (el, i) {
+      if (el.dataset.gaiaChained) return;
+      el.dataset.gaiaChained = "1";
+      el.addEventListener("play", function () { waiting = false; });
+      el.addEventListener("ended", function () {
+        const next = clips()[i + 1];
+        if (next) { next.play(); } else { waiting = true; }
+      });
+      if (waiting && (i === 0 || clips()[i - 1].ended)) { waiting = false; el.play(); }
+    });
+  }
+
+  new MutationObserver(attach).observe(doc.body, { childList: true, subtree: true });
+  attach();
+})();
+</script>
+"""
@@ -4,19 +4,25 @@ import io
 from openai import OpenAI
 import dotenv
 import os
+import outbound
+from audio_cache import STT_CACHE
+from audio_preprocess import preprocess
 
 openai_api_key = os.environ["OPENAI_API_KEY"]
 
 # This code is Streamlit component that records audio from user's microphone, send to OpenAI whisper API for transcription.
-# mic recorder is to record from user's mic and return mp3; Bytesio is to wrap raw audio so whisper can read.
+# mic recorder is to record from user's mic and return wav (shrunk by audio_preprocess before upload); Bytesio is to wrap raw audio so whisper can read.
 
 # Function to check whether OpenAI client has been initialized in st.session_state
 # If not it loads env variable via dotenv and creates OpenAI client using whisper model.
 def whisper_stt(openai_api_key=None, start_prompt="Start recording", stop_prompt="Stop recording", just_once=False,
-               use_container_width=False, language=None, callback=None, args=(), kwargs=None, key=None):
+               use_container_width=False, language=None, callback=None, args=(), kwargs=None, key=None,
+               format="wav", codec=None):
+    # format="wav" records uncompressed audio so audio_preprocess can trim/downmix/resample it before upload.
+    # codec (or STT_AUDIO_CODEC in .env, e.g. "mp3") re-encodes the result if pydub + ffmpeg are installed.
     if not 'openai_client' in st.session_state:
         dotenv.load_dotenv()
-        st.session_state.openai_client = OpenAI(api_key=openai_api_key or os.getenv('OPENAI_API_KEY'))
+        st.session_state.openai_client = OpenAI(api_key=openai_api_key or os.getenv('OPENAI_API_KEY'), max_retries=0)
 
     # initializing state for transcript tracking; last audio it processed and last transcript output
     # If you pass a key, stores output in session_state[key+ '_output']
@@ -29,7 +35,7 @@ def whisper_stt(openai_api_key=None, start_prompt="Start recording", stop_prompt
 
     # Recording audio with mic_recorder; when its finished user gets audio content (bytes), and id (recording session id)
     audio = mic_recorder(start_prompt=start_prompt, stop_prompt=stop_prompt, just_once=just_once,
-                         use_container_width=use_container_width, key=key)
+                         use_container_width=use_container_width, format=format, key=key)
     new_output = False
     if audio is None:
         output = None
@@ -39,25 +45,43 @@ def whisper_stt(openai_api_key=None, start_prompt="Start recording", stop_prompt
         if new_output:
             output = None
             st.session_state._last_speech_to_text_transcript_id = id
-            audio_bio = io.BytesIO(audio['bytes'])
-            audio_bio.name = 'audio.mp3'
-            success = False
-            err = 0
-            while not success and err < 3:  # Retry up to 3 times in case of OpenAI server error.
-                
-                # sending audio to whisper API
+            audio_bytes = audio['bytes']
+            client = st.session_state.openai_client
+            upload = {}
+
+            # Build a fresh BytesIO per attempt: a failed upload leaves the old one at EOF,
+            # and a hedge request running at the same time needs its own file object.
+            def _transcribe():
+                audio_bio = io.BytesIO(upload["bytes"])
+                audio_bio.name = upload["name"]
+                return client.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=audio_bio,
+                    language=language
+                )
+
+            # Same audio + language transcribed before? Reuse the cached transcript (keyed by content hash)
+            cache_key = STT_CACHE.make_key("whisper-1", language or "", audio_bytes)
+            cached = STT_CACHE.get_path(cache_key, ".txt")
+            if cached:
+                with open(cached, encoding="utf-8") as f:
+                    output = f.read()
+                st.session_state._last_speech_to_text_transcript = output
+            else:
+                # Shrink the upload first: trim silence, mono, 16 kHz (see audio_preprocess.py)
+                upload["bytes"], upload["name"], stats = preprocess(
+                    audio_bytes, codec=codec or os.getenv("STT_AUDIO_CODEC") or None
+                )
+                st.session_state._last_audio_preprocess = stats
+
+                # sending audio to whisper API through the shared outbound layer (rate limit + backoff retries)
                 try:
-                    transcript = st.session_state.openai_client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_bio,
-                        language=language
-                    )
+                    transcript = outbound.call("openai", _transcribe, key=("stt", cache_key), hedge=True)
                 except Exception as e:
                     print(str(e))  # log the exception in the terminal
-                    err += 1
                 else:
-                    success = True
                     output = transcript.text
+                    STT_CACHE.put(cache_key, ".txt", output.encode("utf-8"))
                     st.session_state._last_speech_to_text_transcript = output
         elif not just_once:
             output = st.session_state._last_speech_to_text_transcript